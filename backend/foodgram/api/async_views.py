@@ -0,0 +1,124 @@
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api.search import ingredient_index
+from .views import IngredientViewSet, RecipeViewSet, UserViewSet
+
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+DETAIL_ACTIONS = {
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+}
+
+
+def in_thread(view):
+    """
+    Выполняет синхронное представление в пуле потоков. Django 3.2 под
+    ASGI запускает все синхронные представления процесса в одном общем
+    потоке, поэтому медленный запрос к базе задерживает остальные.
+    Соединения с базой у каждого потока свои и закрываются после
+    ответа, как это делает обработчик сигнала request_finished.
+    """
+    def run(request, *args, **kwargs):
+        close_old_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def csrf_exempt(view):
+    """csrf_exempt из Django 3.2 превращает асинхронное представление
+    в синхронное, поэтому отметку ставим сами."""
+    view.csrf_exempt = True
+    return view
+
+
+def json_response(data, **headers):
+    response = HttpResponse(
+        JSONRenderer().render(data), content_type='application/json')
+    response['Vary'] = 'Accept'
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def is_plain_anonymous_get(request):
+    """Анонимный GET без условных заголовков можно отдать из кэша."""
+    return request.method == 'GET' and not any(
+        header in request.META for header in (
+            'HTTP_AUTHORIZATION',
+            'HTTP_IF_NONE_MATCH',
+            'HTTP_IF_MODIFIED_SINCE',
+        ))
+
+
+def cached_view(viewset, actions):
+    """
+    Асинхронная версия list/retrieve вьюсета с SharedResponseCacheMixin.
+    Попадание в общий кэш для анонимного запроса обслуживается без
+    обращения к базе и без синхронного потока, остальные запросы
+    передаются обычному представлению через in_thread().
+    """
+    sync_view = in_thread(viewset.as_view(actions))
+
+    def lookup(request, action, kwargs):
+        # Ключ строится тем же get_response_cache_key, что и в
+        # синхронном представлении, вместе с хостом и схемой запроса.
+        view = viewset(action=action, kwargs=kwargs, args=())
+        view.request = Request(request)
+        return view.get_cached_data(
+            view.get_response_cache_key(view.request))
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if is_plain_anonymous_get(request):
+            data = await sync_to_async(lookup, thread_sensitive=False)(
+                request, actions['get'], kwargs)
+            if data is not None:
+                return json_response(data, **{'X-Cache': 'HIT'})
+        return await sync_view(request, *args, **kwargs)
+    return view
+
+
+recipe_list = cached_view(RecipeViewSet, LIST_ACTIONS)
+recipe_detail = cached_view(RecipeViewSet, DETAIL_ACTIONS)
+subscriptions_view = in_thread(UserViewSet.as_view({'get': 'subscriptions'}))
+
+
+@csrf_exempt
+async def subscriptions(request):
+    return await subscriptions_view(request)
+
+
+@csrf_exempt
+async def ingredient_autocomplete(request):
+    """
+    Подсказки по ингредиентам. Поиск идёт по индексу в памяти прямо в
+    цикле событий: проверка его версии — одно чтение из кэша, к базе
+    обращается только перестроение индекса.
+    """
+    if request.method != 'GET':
+        return HttpResponse(status=405)
+    data = ingredient_index.snapshot()
+    if data is None:
+        data = await sync_to_async(
+            ingredient_index.refresh, thread_sensitive=False)()
+    try:
+        limit = min(
+            int(request.GET.get(
+                'limit', IngredientViewSet.autocomplete_limit)),
+            IngredientViewSet.autocomplete_max_limit)
+    except ValueError:
+        limit = IngredientViewSet.autocomplete_limit
+    return json_response(ingredient_index.search(
+        request.GET.get('name', ''), max(limit, 1), data))
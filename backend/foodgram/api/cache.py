@@ -0,0 +1,168 @@
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def get_version(name):
+    """Текущая версия пространства имён кэша.
+    Ключи с устаревшей версией просто перестают читаться. Версии живут
+    CACHE_VERSION_TTL секунд: если сброс произошёл в другом процессе
+    с локальным кэшем, устаревшая версия всё равно скоро сменится."""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is not None:
+        return version
+    cache.add(key, uuid.uuid4().hex, settings.CACHE_VERSION_TTL)
+    return cache.get(key)
+
+
+def bump_version(*names):
+    cache.set_many(
+        {_version_key(name): uuid.uuid4().hex for name in names},
+        settings.CACHE_VERSION_TTL)
+
+
+def _increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_response_cache_stats():
+    hits = cache.get('response_cache:hits', 0)
+    misses = cache.get('response_cache:misses', 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+class SharedResponseCacheMixin:
+    """
+    Кэширует общую для всех пользователей часть ответов list/retrieve.
+    Ответ строится без учёта пользователя и зависит только от адреса
+    и строки запроса, а персональные поля заполняет personalize().
+    Запросы авторизованных пользователей с фильтрами из
+    user_filter_params целиком зависят от пользователя и в общий кэш
+    не попадают. Ключ включает версии пространств имён из
+    get_response_cache_namespaces(), которые сбрасываются сигналами
+    при изменении данных. В заголовке X-Cache ответ помечается HIT
+    или MISS, общие счётчики возвращает get_response_cache_stats().
+    """
+    response_cache_timeout = settings.RESPONSE_CACHE_TTL
+    user_filter_params = ()
+
+    def get_response_cache_namespaces(self):
+        raise NotImplementedError
+
+    def personalize(self, request, data):
+        """Заполняет в общем ответе поля текущего пользователя."""
+
+    def is_shared_response(self, request):
+        return request.user.is_anonymous or not any(
+            request.query_params.get(param)
+            for param in self.user_filter_params)
+
+    def get_response_cache_key(self, request):
+        # Ссылки в ответе (пагинация, изображения) абсолютные, поэтому
+        # ответы для разных хостов и схем кэшируются раздельно.
+        params = sorted(request.query_params.lists())
+        digest = hashlib.md5(json.dumps([
+            request.scheme, request.get_host(), request.path, params,
+        ]).encode()).hexdigest()
+        versions = ':'.join(
+            get_version(name)
+            for name in self.get_response_cache_namespaces())
+        return f'response:{versions}:{digest}'
+
+    @staticmethod
+    def get_cached_data(key):
+        data = cache.get(key)
+        if data is not None:
+            _increment('response_cache:hits')
+        return data
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not self.is_shared_response(request):
+            response = handler(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                self.personalize(request, response.data)
+            return response
+        key = self.get_response_cache_key(request)
+        data = self.get_cached_data(key)
+        if data is not None:
+            self.personalize(request, data)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        _increment('response_cache:misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, self.response_cache_timeout)
+            self.personalize(request, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы для list/retrieve. get_conditional_state()
+    возвращает строку, из которой строится ETag, и время последнего
+    изменения (или None). Если клиент прислал совпадающие
+    If-None-Match/If-Modified-Since, отвечаем 304 без сериализации.
+    """
+
+    def get_conditional_state(self, request):
+        return None, None
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        state, last_modified = self.get_conditional_state(request)
+        if state is None and last_modified is None:
+            return handler(request, *args, **kwargs)
+        etag = None
+        if state is not None:
+            etag = '"{}"'.format(hashlib.md5(json.dumps(
+                [state, request.path, sorted(request.query_params.lists())]
+            ).encode()).hexdigest())
+        timestamp = last_modified and int(last_modified.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (
+                status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            if etag is not None:
+                response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs)
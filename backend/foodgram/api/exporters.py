@@ -0,0 +1,114 @@
+import csv
+import hashlib
+import io
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+EXPORTERS = {}
+
+
+def register_exporter(exporter):
+    """Регистрирует формат выгрузки списка покупок."""
+    EXPORTERS[exporter.format] = exporter
+    return exporter
+
+
+class ShoppingCartExporter(BaseRenderer):
+    """
+    Базовый класс выгрузки списка покупок. DRF использует его как
+    рендерер только для выбора формата по параметру format или
+    заголовку Accept, сам файл собирает export().
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    @property
+    def filename(self):
+        return f'shopping_list.{self.format}'
+
+    def begin(self):
+        return ''
+
+    def row(self, ingredient, index):
+        raise NotImplementedError
+
+    def end(self):
+        return ''
+
+    def export(self, ingredients):
+        """Собирает файл из уже прочитанных строк списка покупок."""
+        parts = [self.begin()]
+        parts.extend(
+            self.row(ingredient, index)
+            for index, ingredient in enumerate(ingredients))
+        parts.append(self.end())
+        return ''.join(parts).encode(self.charset)
+
+    def etag(self, content):
+        digest = hashlib.md5(self.format.encode())
+        digest.update(content)
+        return f'"{digest.hexdigest()}"'
+
+
+@register_exporter
+class TxtExporter(ShoppingCartExporter):
+    """Список покупок в виде текста."""
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def begin(self):
+        return 'Купить в магазине:'
+
+    def row(self, ingredient, index):
+        return (
+            f"\n{ingredient['ingredient__name']} "
+            f"({ingredient['ingredient__measurement_unit']}) - "
+            f"{ingredient['amount']}")
+
+
+@register_exporter
+class CsvExporter(ShoppingCartExporter):
+    """Список покупок в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    @staticmethod
+    def _line(*values):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        return buffer.getvalue()
+
+    def begin(self):
+        return self._line('name', 'measurement_unit', 'amount')
+
+    def row(self, ingredient, index):
+        return self._line(
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'])
+
+
+@register_exporter
+class JsonExporter(ShoppingCartExporter):
+    """Список покупок в формате JSON."""
+    media_type = 'application/json'
+    format = 'json'
+
+    def begin(self):
+        return '['
+
+    def row(self, ingredient, index):
+        item = json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['amount'],
+        }, ensure_ascii=False)
+        return item if index == 0 else f',{item}'
+
+    def end(self):
+        return ']'
@@ -0,0 +1,283 @@
+import csv
+import io
+import json
+import os
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+BASELINE_PATH = os.path.join(
+    settings.BASE_DIR, 'api', 'benchmarks', 'baseline.json')
+INGREDIENTS_PATHS = (
+    os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+    os.path.join(settings.BASE_DIR, '..', '..', 'data', 'ingredients.csv'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер числа SQL-запросов и задержек эндпоинтов API на '
+        'синтетических данных во временной базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--requests', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--baseline', default=BASELINE_PATH)
+        parser.add_argument(
+            '--tolerance', type=float, default=1.0,
+            help='Допустимый рост p95 относительно базовой линии (доля).')
+        parser.add_argument(
+            '--queries-only', action='store_true',
+            help='Сравнивать с базовой линией только число запросов: '
+                 'задержки на общих машинах CI слишком шумные.')
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Записать результаты как новую базовую линию.')
+
+    # Фоновые задачи выполняются в запросе: временная база SQLite в
+    # памяти не выдерживает записи из других потоков.
+    @override_settings(BACKGROUND_TASKS_SYNC=True)
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        try:
+            context = self.seed(options)
+            results = {}
+            for name, client, method, url, *extra in self.scenarios(
+                    context):
+                results[name] = self.measure(
+                    client, method, url, options['requests'],
+                    **(extra[0] if extra else {}))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.report(results)
+        if options['update_baseline']:
+            os.makedirs(os.path.dirname(options['baseline']), exist_ok=True)
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS('Базовая линия обновлена.'))
+            return
+        self.compare(
+            results, options['baseline'],
+            None if options['queries_only'] else options['tolerance'])
+
+    def seed(self, options):
+        rnd = random.Random(options['seed'])
+        path = next(
+            (path for path in INGREDIENTS_PATHS if os.path.exists(path)),
+            None)
+        if path is None:
+            raise CommandError('Не найден файл data/ingredients.csv.')
+        with open(path, encoding='utf-8') as csv_file:
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in csv.reader(csv_file)],
+                batch_size=1000)
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', color=f'#{i:06X}', slug=f'tag-{i}')
+            for i in range(5))
+        tags = list(Tag.objects.all())
+        User.objects.bulk_create(
+            User(email=f'user{i}@example.com', username=f'user{i}',
+                 first_name='Имя', last_name='Фамилия')
+            for i in range(options['users']))
+        users = list(User.objects.all())
+        recipes = [
+            Recipe(author=rnd.choice(users), name=f'Рецепт {i}',
+                   text='Описание рецепта', cooking_time=rnd.randint(1, 120),
+                   image='recipes/image/benchmark.png')
+            for i in range(options['recipes'])
+        ]
+        # bulk_create не возвращает первичные ключи на SQLite.
+        for recipe in recipes:
+            recipe.save()
+        Recipe.tags.through.objects.bulk_create(
+            [Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+             for recipe in recipes for tag in rnd.sample(tags, 2)],
+            batch_size=1000)
+        IngredientRecipe.objects.bulk_create(
+            [IngredientRecipe(recipe=recipe, ingredient_id=ingredient_id,
+                              amount=rnd.randint(1, 500))
+             for recipe in recipes
+             for ingredient_id in rnd.sample(ingredient_ids, 5)],
+            batch_size=1000)
+        Follow.objects.bulk_create(
+            [Follow(user=user, author=author)
+             for user in users
+             for author in rnd.sample(users, 5)
+             if author != user],
+            batch_size=1000)
+        for model, per_user in ((Favorite, 20), (ShoppingCart, 10)):
+            model.objects.bulk_create(
+                [model(user=user, recipe=recipe)
+                 for user in users
+                 for recipe in rnd.sample(recipes, per_user)],
+                batch_size=1000)
+        call_command('recount_recipes', stdout=io.StringIO())
+        call_command('rebuild_shopping_carts', stdout=io.StringIO())
+        call_command('rebuild_feeds', stdout=io.StringIO())
+        user = users[0]
+        return {
+            'user': user,
+            'toggle_recipe': Recipe.objects.exclude(
+                favorites__user=user).exclude(
+                shopping_cart__user=user).first(),
+            'toggle_author': User.objects.exclude(id=user.id).exclude(
+                following__user=user).first(),
+            'recipe': recipes[0],
+            'author': recipes[0].author,
+            'tag': tags[0],
+            'anon': Client(),
+            'auth': Client(HTTP_AUTHORIZATION=(
+                f'Token {Token.objects.create(user=user).key}')),
+        }
+
+    @staticmethod
+    def scenarios(context):
+        """(имя, клиент, метод, адрес[, параметры measure()]). Для
+        ответов из общего кэша есть варианты *_uncached: кэш очищается
+        перед каждым запросом, чтобы замерять запросы к базе."""
+        anon, auth = context['anon'], context['auth']
+        recipe, tag = context['recipe'], context['tag']
+        ingredients_etag = anon.get('/api/ingredients/')['ETag']
+        shared = (
+            ('recipes_list_anon', anon, 'get', '/api/recipes/'),
+            ('recipes_list_tags', anon, 'get',
+             f'/api/recipes/?tags={tag.slug}'),
+            ('recipes_list_cursor', anon, 'get',
+             '/api/recipes/?cursor='),
+            ('recipes_list_search', anon, 'get',
+             '/api/recipes/?search=рецепт'),
+            ('recipes_list_popular', anon, 'get',
+             '/api/recipes/?ordering=-favorites_count'),
+            ('recipes_detail_anon', anon, 'get',
+             f'/api/recipes/{recipe.id}/'),
+        )
+        uncached = tuple(
+            (f'{name}_uncached', *scenario, {'cached': False})
+            for name, *scenario in shared)
+        return shared + uncached + (
+            ('recipes_list_auth', auth, 'get', '/api/recipes/?limit=20'),
+            ('recipes_list_favorited', auth, 'get',
+             '/api/recipes/?is_favorited=1'),
+            ('recipes_detail_auth', auth, 'get',
+             f'/api/recipes/{recipe.id}/'),
+            ('recipes_feed', auth, 'get', '/api/recipes/feed/'),
+            ('recipes_feed_cursor', auth, 'get',
+             '/api/recipes/feed/?cursor='),
+            ('download_shopping_cart', auth, 'get',
+             '/api/recipes/download_shopping_cart/'),
+            ('tags_list', anon, 'get', '/api/tags/'),
+            ('tags_detail', anon, 'get', f'/api/tags/{tag.id}/'),
+            ('ingredients_list', anon, 'get', '/api/ingredients/'),
+            ('ingredients_list_not_modified', anon, 'get',
+             '/api/ingredients/',
+             {'headers': {'HTTP_IF_NONE_MATCH': ingredients_etag}}),
+            ('ingredients_search', anon, 'get',
+             '/api/ingredients/?name=мол'),
+            ('ingredients_autocomplete', anon, 'get',
+             '/api/ingredients/autocomplete/?name=мол'),
+            ('users_list', auth, 'get', '/api/users/'),
+            ('users_detail', auth, 'get',
+             f'/api/users/{context["author"].id}/'),
+            ('users_me', auth, 'get', '/api/users/me/'),
+            ('users_subscriptions', auth, 'get',
+             '/api/users/subscriptions/?recipes_limit=3'),
+            ('users_subscriptions_cursor', auth, 'get',
+             '/api/users/subscriptions/?recipes_limit=3&cursor='),
+            ('favorite_toggle', auth, ('post', 'delete'),
+             f'/api/recipes/{context["toggle_recipe"].id}/favorite/'),
+            ('shopping_cart_toggle', auth, ('post', 'delete'),
+             f'/api/recipes/{context["toggle_recipe"].id}/shopping_cart/'),
+            ('subscribe_toggle', auth, ('post', 'delete'),
+             f'/api/users/{context["toggle_author"].id}/subscribe/'),
+        )
+
+    @staticmethod
+    def measure(client, methods, url, requests, headers=None, cached=True):
+        """methods — метод или кортеж методов, которые выполняются
+        подряд как одна операция, например ('post', 'delete').
+        При cached=False кэш очищается перед каждой операцией."""
+        if isinstance(methods, str):
+            methods = (methods, )
+        timings = []
+        queries = 0
+        # Первый запрос прогревает кэши и в замеры не входит.
+        for attempt in range(requests + 1):
+            if not cached:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                for method in methods:
+                    response = getattr(client, method)(
+                        url, **(headers or {}))
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    if response.status_code >= 400:
+                        raise CommandError(
+                            f'{method.upper()} {url}: '
+                            f'{response.status_code}')
+                elapsed = (time.perf_counter() - start) * 1000
+            if attempt:
+                timings.append(elapsed)
+                queries = max(queries, len(captured.captured_queries))
+        timings.sort()
+        return {
+            'queries': queries,
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(timings[int(0.95 * (len(timings) - 1))], 2),
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"сценарий":<32}{"запросы":>8}{"p50, мс":>10}{"p95, мс":>10}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<32}{result["queries"]:>8}'
+                f'{result["p50_ms"]:>10.2f}{result["p95_ms"]:>10.2f}')
+
+    def compare(self, results, path, tolerance):
+        if not os.path.exists(path):
+            raise CommandError(
+                f'Нет базовой линии {path}, запустите с --update-baseline.')
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        errors = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            if result['queries'] > expected['queries']:
+                errors.append(
+                    f'{name}: {result["queries"]} запросов '
+                    f'вместо {expected["queries"]}')
+            if tolerance is None:
+                continue
+            if result['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+                errors.append(
+                    f'{name}: p95 {result["p95_ms"]} мс '
+                    f'при базовых {expected["p95_ms"]} мс')
+        if errors:
+            raise CommandError('Регрессия:\n' + '\n'.join(errors))
+        self.stdout.write(self.style.SUCCESS('Регрессий не найдено.'))
@@ -0,0 +1,75 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management import BaseCommand, CommandError
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/ingredients/autocomplete/?name=мол',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест запущенных серверов: одинаковые запросы с '
+        'одинаковой конкурентностью к каждому адресу из --target, '
+        'например к WSGI- и ASGI-режиму.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', required=True,
+            help='Базовый адрес сервера, можно указать несколько раз.')
+        parser.add_argument(
+            '--path', action='append',
+            help='Путь запроса, можно указать несколько раз.')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument(
+            '--token', help='Токен для заголовка Authorization.')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        paths = options['path'] or DEFAULT_PATHS
+        headers = {'Accept': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        self.stdout.write(
+            f'{"адрес":<32} {"запр/с":>9} {"ошибок":>7} '
+            f'{"p50, мс":>9} {"p95, мс":>9}')
+        for target in options['target']:
+            urls = [
+                target.rstrip('/') + quote(paths[i % len(paths)], safe='/?=&%')
+                for i in range(options['requests'])
+            ]
+            self.fetch(urls[0], headers, options['timeout'])
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                results = list(executor.map(
+                    lambda url: self.fetch(url, headers, options['timeout']),
+                    urls))
+            elapsed = time.perf_counter() - started
+            timings = sorted(timing for ok, timing in results if ok)
+            errors = len(results) - len(timings)
+            if not timings:
+                raise CommandError(f'{target}: все запросы с ошибкой.')
+            self.stdout.write(
+                f'{target:<32} {len(results) / elapsed:>9.1f} '
+                f'{errors:>7} {statistics.median(timings):>9.2f} '
+                f'{timings[int(len(timings) * 0.95) - 1]:>9.2f}')
+
+    @staticmethod
+    def fetch(url, headers, timeout):
+        started = time.perf_counter()
+        try:
+            with urlopen(Request(url, headers=headers),
+                         timeout=timeout) as response:
+                response.read()
+        except (HTTPError, URLError, OSError):
+            return False, None
+        return True, (time.perf_counter() - started) * 1000
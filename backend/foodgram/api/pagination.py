@@ -1,7 +1,177 @@
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import get_version
+
+
+class CountingPaginator(Paginator):
+    """Paginator, которому число записей передаётся функцией."""
+
+    def __init__(self, *args, count_func, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_func = count_func
+
+    @cached_property
+    def count(self):
+        return self.count_func()
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL."""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
 
 
 class CustomPagination(PageNumberPagination):
+    """
+    Постраничная пагинация page/limit. Если вьюсет задаёт
+    count_cache_namespace, число записей кэшируется по нормализованным
+    параметрам фильтрации на PAGINATION_COUNT_CACHE_TTL секунд; для
+    анонимных запросов на PostgreSQL можно включить оценку числа строк
+    по плану запроса (PAGINATION_ESTIMATED_COUNT).
+
+    Если в запросе есть параметр
+    cursor, а вьюсет задаёт порядок для курсора (get_cursor_ordering),
+    включается пагинация по ключу: следующая страница выбирается
+    условием по последней записи, без COUNT(*) и OFFSET.
+    """
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 20
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        get_cursor_ordering = getattr(view, 'get_cursor_ordering', None)
+        self.cursor_ordering = get_cursor_ordering and get_cursor_ordering()
+        if (self.cursor_ordering
+                and self.cursor_query_param in request.query_params):
+            return self.paginate_queryset_by_cursor(queryset, request)
+        self.cursor_ordering = None
+        self.django_paginator_class = partial(
+            CountingPaginator,
+            count_func=lambda: self.get_count(queryset, request, view))
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_cache_key(self, request, view):
+        namespace = getattr(view, 'count_cache_namespace', None)
+        if namespace is None or getattr(view, 'action', 'list') != 'list':
+            return None
+        user_params = getattr(view, 'user_filter_params', ())
+        if request.user.is_authenticated and any(
+                request.query_params.get(param) for param in user_params):
+            return None
+        skip = {self.page_query_param, self.page_size_query_param,
+                self.cursor_query_param, 'ordering'}
+        params = sorted(
+            (key, value) for key, values in request.query_params.lists()
+            if key not in skip for value in values)
+        digest = hashlib.md5(
+            json.dumps([request.path, params]).encode()).hexdigest()
+        return f'count:{namespace}:{get_version(namespace)}:{digest}'
+
+    def get_count(self, queryset, request, view):
+        if (settings.PAGINATION_ESTIMATED_COUNT
+                and request.user.is_anonymous
+                and connections[queryset.db].vendor == 'postgresql'):
+            estimate = estimate_count(queryset)
+            if estimate >= settings.PAGINATION_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        key = self.get_count_cache_key(request, view)
+        if key is None:
+            return queryset.count()
+        return cache.get_or_set(
+            key, queryset.count, settings.PAGINATION_COUNT_CACHE_TTL)
+
+    def paginate_queryset_by_cursor(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.cursor_ordering)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(
+                self.after(self.decode_cursor(cursor, queryset)))
+        page = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_cursor = self.encode_cursor(page[-1])
+        return page
+
+    def after(self, values):
+        """Условие «строго после» для упорядочивания cursor_ordering."""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.cursor_ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, obj):
+        values = []
+        for field in self.cursor_ordering:
+            value = getattr(obj, field.lstrip('-'))
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(
+            json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor, queryset):
+        """Значения курсора, приведённые к типам полей упорядочивания."""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(values, list)
+                or len(values) != len(self.cursor_ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        parsed = []
+        for field, value in zip(self.cursor_ordering, values):
+            if not isinstance(value, (str, int)) or isinstance(value, bool):
+                raise NotFound(self.invalid_cursor_message)
+            output_field = queryset.query.resolve_ref(
+                field.lstrip('-')).output_field
+            try:
+                parsed.append(output_field.to_python(value))
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return parsed
+
+    def get_next_cursor_link(self):
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(
+            url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_ordering:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_cursor_link()),
+            ('results', data),
+        ]))
@@ -5,6 +5,10 @@ class AuthorOrReadOnlyPermission(BasePermission):
     """Права доступа для автора рецепта. Автор может изменять
     и удалять объекты, созданные им."""
 
+    def has_permission(self, request, view):
+        return (request.method in SAFE_METHODS
+                or request.user.is_authenticated)
+
     def has_object_permission(self, request, view, obj):
         return (request.method in SAFE_METHODS
                 or obj.author == request.user)
@@ -0,0 +1,89 @@
+import bisect
+import threading
+import time
+
+from recipes.models import Ingredient
+from .cache import get_version
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+    Названия хранятся отсортированными в нижнем регистре, поиск по
+    префиксу идёт бинарным поиском. Индекс строится при первом
+    обращении и запоминает версию 'ingredients' из общего кэша, которую
+    сигналы меняют при изменении ингредиентов в любом процессе: при
+    несовпадении версии индекс перестраивается. Кроме того, он
+    перестраивается не реже чем раз в max_age секунд на случай, если
+    версия сменилась до фиксации транзакции.
+    """
+    max_age = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._built_at = 0
+        self._version = None
+
+    def invalidate(self):
+        self._data = None
+
+    def _build(self):
+        items = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (item['name'].casefold(), item['id']))
+        return [item['name'].casefold() for item in items], items
+
+    def is_stale(self):
+        return (
+            self._data is None
+            or self._version != get_version('ingredients')
+            or time.monotonic() - self._built_at > self.max_age)
+
+    def refresh(self):
+        """Перестраивает индекс, если он устарел."""
+        with self._lock:
+            if self.is_stale():
+                # Версия читается до выборки: если ингредиенты изменятся
+                # во время построения, следующий вызов перестроит индекс.
+                version = get_version('ingredients')
+                self._data = self._build()
+                self._version = version
+                self._built_at = time.monotonic()
+        return self._data
+
+    def snapshot(self):
+        """Текущий индекс или None, если его нужно перестроить."""
+        if self.is_stale():
+            return None
+        return self._data
+
+    def _get(self):
+        return self.snapshot() or self.refresh()
+
+    def search(self, query, limit, data=None):
+        """
+        Сначала совпадения по началу названия, затем по подстроке.
+        data — уже полученный снимок индекса, если вызывающий код сам
+        обновил его через refresh().
+        """
+        keys, items = data or self._get()
+        query = query.strip().casefold()
+        if not query:
+            return items[:limit]
+        position = bisect.bisect_left(keys, query)
+        found = []
+        while (position < len(keys) and len(found) < limit
+               and keys[position].startswith(query)):
+            found.append(items[position])
+            position += 1
+        if len(found) < limit:
+            for key, item in zip(keys, items):
+                if query in key and not key.startswith(query):
+                    found.append(item)
+                    if len(found) == limit:
+                        break
+        return found
+
+
+ingredient_index = IngredientIndex()
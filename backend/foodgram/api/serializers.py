@@ -1,25 +1,26 @@
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.db import transaction
-from django.shortcuts import get_object_or_404
 from djoser.serializers import (
     UserCreateSerializer as DjoserUserCreateSerializer)
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 from drf_extra_fields.fields import Base64ImageField
-from rest_framework import serializers, status
-from rest_framework.exceptions import ValidationError
+from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 
+from recipes.images import process_recipe_image
 from recipes.models import (
     Ingredient, Tag, Recipe, IngredientRecipe,
-    Favorite, ShoppingCart
+    ShoppingCartIngredient, UploadedImage
 )
+from recipes.tasks import run_in_background
 
 User = get_user_model()
 
 
 class UserSerializer(DjoserUserSerializer):
     """Сериализатор модели пользователя."""
-    is_subscribed = serializers.BooleanField(read_only=True)
+    is_subscribed = SerializerMethodField()
 
     class Meta:
         model = User
@@ -33,6 +34,9 @@ class UserSerializer(DjoserUserSerializer):
         ]
 
     def get_is_subscribed(self, obj):
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
@@ -53,12 +57,34 @@ class UserCreateSerializer(DjoserUserCreateSerializer):
         ]
 
 
+class SrcsetField(serializers.Field):
+    """Адреса уменьшенных копий изображения: {формат: {ширина: url}}."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image_variants'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        srcset = {}
+        for image_format, sizes in variants.items():
+            srcset[image_format] = {}
+            for width, name in sizes.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                srcset[image_format][width] = url
+        return srcset
+
+
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Сериализатор для полей избранных рецептов и покупок."""
+    srcset = SrcsetField()
 
     class Meta:
         model = Recipe
-        fields = ['id', 'name', 'image', 'cooking_time']
+        fields = ['id', 'name', 'image', 'srcset', 'cooking_time']
 
 
 class SubscribeListSerializer(UserSerializer):
@@ -70,33 +96,21 @@ class SubscribeListSerializer(UserSerializer):
         fields = UserSerializer.Meta.fields + ['recipes_count', 'recipes']
         read_only_fields = ['email', 'username', 'first_name', 'last_name']
 
-    def validate(self, data):
-        author_id = self.context.get(
-            'request').parser_context.get('kwargs').get('id')
-        author = get_object_or_404(User, id=author_id)
-        user = self.context.get('request').user
-        if user.follower.filter(author=author_id).exists():
-            raise ValidationError(
-                detail='Подписка на этого автора уже существует!',
-                code=status.HTTP_400_BAD_REQUEST,
-            )
-        if user == author:
-            raise ValidationError(
-                detail='Нельзя подписаться на самого себя!',
-                code=status.HTTP_400_BAD_REQUEST,
-            )
-        return data
-
     @staticmethod
     def get_recipes_count(obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[: int(limit)]
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            recipes = obj.recipes.all()
+            if limit:
+                recipes = recipes[: int(limit)]
         serializer = RecipeShortSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
@@ -133,7 +147,7 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
 class IngredientsEditSerializer(serializers.ModelSerializer):
 
     id = serializers.IntegerField()
-    amount = serializers.IntegerField()
+    amount = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = Ingredient
@@ -144,10 +158,13 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     """Сериализатор для просмотра рецептов."""
     tags = TagSerializer(many=True)
     author = UserSerializer(read_only=True)
-    ingredients = IngredientsEditSerializer(many=True)
-    is_favorited = serializers.BooleanField(False, read_only=True)
-    is_in_shopping_cart = serializers.BooleanField(False, read_only=True)
+    ingredients = IngredientRecipeSerializer(
+        many=True, source='ingredient_list')
+    is_favorited = serializers.BooleanField(read_only=True, default=False)
+    is_in_shopping_cart = serializers.BooleanField(
+        read_only=True, default=False)
     image = Base64ImageField(max_length=None)
+    srcset = SrcsetField()
 
     class Meta:
         model = Recipe
@@ -160,6 +177,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'srcset',
             'text',
             'cooking_time'
         ]
@@ -167,7 +185,7 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для создания/обновления рецепта."""
-    ingredients = IngredientRecipeSerializer(
+    ingredients = IngredientsEditSerializer(
         many=True,
     )
     tags = serializers.PrimaryKeyRelatedField(
@@ -175,7 +193,14 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         queryset=Tag.objects.all(),
         error_messages={'does_not_exist': 'Данного тега не существует!'}
     )
-    image = Base64ImageField(max_length=None)
+    image = Base64ImageField(max_length=None, required=False)
+    image_upload = serializers.PrimaryKeyRelatedField(
+        queryset=UploadedImage.objects.all(),
+        write_only=True,
+        required=False,
+        error_messages={
+            'does_not_exist': 'Загруженное изображение не найдено!'}
+    )
     author = UserSerializer(read_only=True)
     cooking_time = serializers.IntegerField()
 
@@ -183,7 +208,27 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = [
             'id', 'tags', 'author', 'ingredients',
-            'name', 'image', 'text', 'cooking_time']
+            'name', 'image', 'image_upload', 'text', 'cooking_time']
+
+    def validate_image_upload(self, upload):
+        if upload.user != self.context['request'].user:
+            raise serializers.ValidationError(
+                'Загруженное изображение не найдено!')
+        return upload
+
+    def validate(self, data):
+        if 'image' in data and 'image_upload' in data:
+            raise serializers.ValidationError(
+                'Укажите либо image, либо image_upload!')
+        if self.instance is None and not (
+                'image' in data or 'image_upload' in data):
+            raise serializers.ValidationError(
+                {'image': ['Обязательное поле.']})
+        upload = data.pop('image_upload', None)
+        if upload is not None:
+            data['image'] = upload.image.name
+            data['uploaded_image'] = upload
+        return data
 
     @staticmethod
     def validate_tags(tags):
@@ -202,7 +247,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         if not set(tags_list).issubset(all_tags):
             raise serializers.ValidationError(
                 'Данного тега не существует!')
-            return tags
+        return tags
 
     @staticmethod
     def validate_cooking_time(cooking_time):
@@ -212,22 +257,20 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         return cooking_time
 
     @staticmethod
-    def validate(ingredients):
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredient = ingredient['ingredient'].get('id')
-            if ingredient in ingredients:
-                raise serializers.ValidationError(
-                    'Ингредиент должен быть уникальным!')
-            ingredients.append(ingredient)
-        all_ingredients = Ingredient.objects.all().values_list(
-            'id', flat=True)
-        if not set(ingredients_list).issubset(all_ingredients):
-            raise serializers.ValidationError(
-                'Указанного ингредиента не существует!')
+    def validate_ingredients(ingredients):
+        ingredients_list = [
+            ingredient['id'] for ingredient in ingredients]
         if len(ingredients_list) == 0:
             raise serializers.ValidationError(
                 'Список ингредиентов не должен быть пустым!')
+        if len(ingredients_list) != len(set(ingredients_list)):
+            raise serializers.ValidationError(
+                'Ингредиент должен быть уникальным!')
+        existing = Ingredient.objects.filter(
+            id__in=ingredients_list).count()
+        if existing != len(ingredients_list):
+            raise serializers.ValidationError(
+                'Указанного ингредиента не существует!')
         return ingredients
 
     @staticmethod
@@ -236,7 +279,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         for ingredient_data in ingredients:
             ingredient_list.append(
                 IngredientRecipe(
-                    ingredient=ingredient_data.pop('id'),
+                    ingredient_id=ingredient_data.pop('id'),
                     amount=ingredient_data.pop('amount'),
                     recipe=recipe,
                 )
@@ -248,18 +291,60 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         request = self.context.get('request', None)
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        upload = validated_data.pop('uploaded_image', None)
         recipe = Recipe.objects.create(author=request.user, **validated_data)
+        if upload is not None:
+            upload.delete()
         recipe.tags.set(tags)
         self.create_ingredients(recipe, ingredients)
+        run_in_background(process_recipe_image, recipe.id)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Приводит состав рецепта к ingredients, меняя только
+        отличающиеся строки. Возвращает старые и новые количества."""
+        current = {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: row.amount
+            for ingredient_id, row in current.items()
+        }
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        self.create_ingredients(recipe, [
+            ingredient for ingredient in ingredients
+            if ingredient['id'] not in current
+        ])
+        return old_amounts, new_amounts
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        IngredientRecipe.objects.filter(recipe=instance).delete()
         instance.tags.set(validated_data.pop('tags'))
-        ingredients = validated_data.pop('ingredients')
-        self.create_ingredients(instance, ingredients)
+        old_amounts, new_amounts = self.update_ingredients(
+            instance, validated_data.pop('ingredients'))
+        if old_amounts != new_amounts:
+            ShoppingCartIngredient.objects.change_recipe(
+                instance, old_amounts, new_amounts)
+        upload = validated_data.pop('uploaded_image', None)
+        if upload is not None:
+            upload.delete()
+        if 'image' in validated_data:
+            run_in_background(process_recipe_image, instance.id)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
@@ -268,45 +353,27 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         }).data
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    """Сериализатор для избранных рецептов."""
-
-    class Meta:
-        model = Favorite
-        fields = ['user', 'recipe']
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массового добавления и удаления."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
 
-    def validate(self, data):
-        user = data['user']
-        if user.favorites.filter(recipe=data['recipe']).exists():
+    def validate_recipes(self, recipe_ids):
+        recipes = Recipe.objects.in_bulk(recipe_ids)
+        missing = sorted(set(recipe_ids) - recipes.keys())
+        if missing:
             raise serializers.ValidationError(
-                'Рецепт уже был добавлен в избранное!'
-            )
-        return data
-
-    def to_representation(self, instance):
-        return RecipeShortSerializer(
-            instance.recipe,
-            context={'request': self.context.get('request')}
-        ).data
+                f'Рецептов не существует: {missing}')
+        return [recipes[recipe_id] for recipe_id in dict.fromkeys(
+            recipe_ids)]
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    """Сериализатор для списка покупок."""
+class UploadedImageSerializer(serializers.ModelSerializer):
+    """Сериализатор для предварительной загрузки изображения рецепта."""
 
     class Meta:
-        model = ShoppingCart
-        fields = ['user', 'recipe']
-
-    def validate(self, data):
-        user = data['user']
-        if user.shopping_list.filter(recipe=data['recipe']).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже добавлен в список покупок!'
-            )
-        return data
-
-    def to_representation(self, instance):
-        return RecipeShortSerializer(
-            instance.recipe,
-            context={'request': self.context.get('request')}
-        ).data
+        model = UploadedImage
+        fields = ['id', 'image']
@@ -0,0 +1,72 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import (DataVersion, Ingredient, IngredientRecipe, Recipe,
+                            Tag)
+from recipes.signals import (ingredients_loaded, recipe_image_processed,
+                             recipes_imported)
+from .cache import bump_version
+from .search import ingredient_index
+
+User = get_user_model()
+
+USER_PUBLIC_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver((post_save, post_delete, ingredients_loaded), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    ingredient_index.invalidate()
+    bump_version('ingredients')
+    DataVersion.objects.bump('ingredients')
+
+
+@receiver(post_save, sender=Recipe)
+def invalidate_recipe_on_save(instance, created, **kwargs):
+    if created:
+        bump_version('recipes')
+    bump_version('recipe_lists', f'recipe:{instance.pk}')
+
+
+@receiver(recipes_imported, sender=Recipe)
+def invalidate_imported_recipes(**kwargs):
+    bump_version('recipes', 'recipe_lists')
+
+
+@receiver(recipe_image_processed, sender=Recipe)
+def invalidate_processed_image(recipe_id, **kwargs):
+    bump_version('recipe_lists', f'recipe:{recipe_id}')
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_on_delete(instance, **kwargs):
+    bump_version('recipes', 'recipe_lists', f'recipe:{instance.pk}')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Recipe):
+        bump_version('recipe_lists', f'recipe:{instance.pk}')
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    bump_version('recipe_lists', f'recipe:{instance.recipe_id}')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag(**kwargs):
+    bump_version('tags', 'recipes', 'recipe_lists', 'recipe_details')
+    DataVersion.objects.bump('tags')
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_author(instance, update_fields=None, **kwargs):
+    if update_fields is not None and not (
+            USER_PUBLIC_FIELDS & set(update_fields)):
+        return
+    recipe_ids = Recipe.objects.filter(
+        author_id=instance.pk).values_list('id', flat=True)
+    bump_version(
+        'recipe_lists',
+        *(f'recipe:{recipe_id}' for recipe_id in recipe_ids))
@@ -0,0 +1,130 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Follow, User
+
+
+class QueryCountTestCase(APITestCase):
+    """Число SQL-запросов на страницу не должно зависеть от её размера."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Читатель', last_name='Читатель', password='pass')
+        User.objects.bulk_create(
+            User(email=f'author{i}@example.com', username=f'author{i}',
+                 first_name='Автор', last_name='Автор')
+            for i in range(21))
+        cls.authors = list(User.objects.exclude(pk=cls.user.pk))
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', color=f'#00000{i}', slug=f'tag-{i}')
+            for i in range(2))
+        tags = list(Tag.objects.all())
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(5))
+        ingredients = list(Ingredient.objects.all())
+        for index, author in enumerate(cls.authors):
+            for number in range(3):
+                recipe = Recipe.objects.create(
+                    author=author, name=f'Рецепт {index}-{number}',
+                    text='Описание', cooking_time=10,
+                    image='recipes/image/test.png')
+                recipe.tags.set(tags)
+                IngredientRecipe.objects.bulk_create(
+                    IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                     amount=number + 1)
+                    for ingredient in ingredients[:3])
+            Follow.objects.create(user=cls.user, author=author)
+        for recipe in Recipe.objects.all()[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.auth_client = APIClient()
+        self.auth_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get(self, client, url, results):
+        cache.clear()
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), results)
+        return response
+
+    def count_queries(self, client, url, results):
+        with CaptureQueriesContext(connection) as context:
+            self.get(client, url, results)
+        return len(context)
+
+    def assert_same_queries(self, client, small_url, large_url, sizes):
+        """Страницы размеров sizes[0] и sizes[1] стоят одинаково."""
+        expected = self.count_queries(client, small_url, sizes[0])
+        with self.assertNumQueries(expected):
+            self.get(client, large_url, sizes[1])
+
+
+class RecipeListQueriesTest(QueryCountTestCase):
+
+    def test_anonymous_list(self):
+        self.assert_same_queries(
+            self.client, '/api/recipes/?limit=6', '/api/recipes/?limit=20',
+            (6, 20))
+
+    def test_authenticated_list(self):
+        self.assert_same_queries(
+            self.auth_client, '/api/recipes/?limit=6',
+            '/api/recipes/?limit=20', (6, 20))
+
+    def test_authenticated_list_marks(self):
+        response = self.get(self.auth_client, '/api/recipes/?limit=20', 20)
+        favorited = set(Favorite.objects.filter(
+            user=self.user).values_list('recipe_id', flat=True))
+        for recipe in response.data['results']:
+            self.assertEqual(
+                recipe['is_favorited'], recipe['id'] in favorited)
+            self.assertTrue(recipe['author']['is_subscribed'])
+            self.assertEqual(len(recipe['ingredients']), 3)
+
+
+class SubscriptionsQueriesTest(QueryCountTestCase):
+    url = '/api/users/subscriptions/'
+
+    def test_page_size(self):
+        self.assert_same_queries(
+            self.auth_client, f'{self.url}?limit=6',
+            f'{self.url}?limit=20', (6, 20))
+
+    def test_recipes_limit(self):
+        self.assert_same_queries(
+            self.auth_client, f'{self.url}?limit=20&recipes_limit=1',
+            f'{self.url}?limit=20&recipes_limit=3', (20, 20))
+
+    def test_page_size_without_recipes_limit(self):
+        self.assert_same_queries(
+            self.auth_client, f'{self.url}?limit=6',
+            f'{self.url}?limit=20&recipes_limit=2', (6, 20))
+
+    def test_cursor_page_size(self):
+        self.assert_same_queries(
+            self.auth_client, f'{self.url}?cursor=&limit=6',
+            f'{self.url}?cursor=&limit=20&recipes_limit=2', (6, 20))
+
+    def test_recipes(self):
+        response = self.get(
+            self.auth_client, f'{self.url}?limit=20&recipes_limit=2', 20)
+        for author in response.data['results']:
+            self.assertTrue(author['is_subscribed'])
+            self.assertEqual(author['recipes_count'], 3)
+            recipes = Recipe.objects.filter(
+                author_id=author['id']).order_by('-pub_date', '-id')
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']],
+                list(recipes.values_list('id', flat=True)[:2]))
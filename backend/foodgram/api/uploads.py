@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParser as DjangoParser
+from django.http.multipartparser import MultiPartParserError
+from PIL import ImageFile
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class LimitedImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загружаемое изображение во временный файл по частям и
+    прерывает загрузку, как только превышен RECIPE_IMAGE_MAX_SIZE или
+    по заголовку файла видно, что сторона изображения больше
+    RECIPE_IMAGE_MAX_DIMENSION. Тело запроса целиком в память не
+    читается.
+    """
+
+    def handle_raw_input(self, input_data, meta, content_length, boundary,
+                         encoding=None):
+        if content_length > settings.RECIPE_IMAGE_MAX_SIZE + 64 * 1024:
+            raise self.too_large()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = ImageFile.Parser()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.file.close()
+            raise self.too_large()
+        if self.header is not None:
+            self.check_dimensions(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_dimensions(self, raw_data):
+        try:
+            self.header.feed(raw_data)
+        except (OSError, SyntaxError):
+            self.header = None
+            return
+        if self.header.image is None:
+            return
+        limit = settings.RECIPE_IMAGE_MAX_DIMENSION
+        width, height = self.header.image.size
+        self.header = None
+        if width > limit or height > limit:
+            self.file.close()
+            raise ValidationError({'image': [
+                f'Изображение не должно быть больше {limit}×{limit} '
+                f'пикселей!']})
+
+    @staticmethod
+    def too_large():
+        size = settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)
+        return ValidationError({'image': [
+            f'Размер изображения не должен превышать {size} МБ!']})
+
+
+class ImageUploadParser(MultiPartParser):
+    """Разбор multipart-запроса с LimitedImageUploadHandler."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        meta = request.META.copy()
+        meta['CONTENT_TYPE'] = media_type
+        handlers = [LimitedImageUploadHandler(request._request)]
+        try:
+            parser = DjangoParser(meta, stream, handlers, encoding)
+            data, files = parser.parse()
+        except MultiPartParserError as exc:
+            raise ParseError(f'Ошибка разбора multipart-запроса: {exc}')
+        return DataAndFiles(data, files)
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from api import async_views
 from api.views import UserViewSet
 from .views import (
     IngredientViewSet, RecipeViewSet,
@@ -14,7 +16,18 @@ router.register(r'tags', TagViewSet, basename='tags')
 router.register(r'recipes', RecipeViewSet, basename='recipes')
 router.register(r'users', UserViewSet, basename='users')
 
-urlpatterns = [
+urlpatterns = []
+
+if settings.SERVER_MODE == 'asgi':
+    urlpatterns += [
+        path('recipes/', async_views.recipe_list),
+        path('recipes/<int:pk>/', async_views.recipe_detail),
+        path('ingredients/autocomplete/',
+             async_views.ingredient_autocomplete),
+        path('users/subscriptions/', async_views.subscriptions),
+    ]
+
+urlpatterns += [
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
@@ -1,30 +1,117 @@
+import re
+
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.db.models.expressions import Exists, OuterRef, Value
-from django.http.response import FileResponse
+from django.db.models import Count, F, Prefetch, prefetch_related_objects
+from django.db.models.expressions import (Exists, OuterRef, RawSQL,
+                                          Subquery, Value)
+from django.http import Http404
+from django.http.response import HttpResponse, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.utils.cache import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
-from rest_framework import status, viewsets
+from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 
-from api.utils import get_shopping_cart
-from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+from api.cache import (ConditionalGetMixin, SharedResponseCacheMixin,
+                       get_response_cache_stats)
+from api.exporters import EXPORTERS
+from api.search import ingredient_index
+from api.uploads import ImageUploadParser
+from recipes.feed import (FEED_ORDERING, backfill_feed, feed_queryset,
+                          remove_from_feed)
+from recipes.models import (DataVersion, Favorite, FeedEntry, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart,
+                            ShoppingCartIngredient, Tag)
+from recipes.tasks import run_in_background
 from users.models import Follow
 from .filters import IngredientFilter, RecipeFilter
 from .pagination import CustomPagination
 from .permissions import AuthorOrReadOnlyPermission
-from .serializers import (CreateRecipeSerializer, FavoriteSerializer,
-                          IngredientSerializer, RecipeReadSerializer,
-                          ShoppingCartSerializer, TagSerializer,
-                          UserSerializer, SubscribeListSerializer)
+from .serializers import (CreateRecipeSerializer, IngredientSerializer,
+                          RecipeIdsSerializer, RecipeReadSerializer,
+                          RecipeShortSerializer, TagSerializer,
+                          UploadedImageSerializer, UserSerializer,
+                          SubscribeListSerializer)
 
 User = get_user_model()
 
+# Не больше 18 цифр, чтобы значение поместилось в bigint.
+INT_PATTERN = re.compile(r'[0-9]{1,18}')
+
+
+def parse_int(value):
+    """
+    Неотрицательное целое из URL или параметра запроса, иначе None.
+    str.isdigit() и int() принимают и не-ASCII цифры вроде '²' или '٣',
+    поэтому строка проверяется шаблоном.
+    """
+    value = str(value)
+    return int(value) if INT_PATTERN.fullmatch(value) else None
+
+
+def invalid_id_response():
+    return Response({'errors': 'Некорректный идентификатор!'},
+                    status=status.HTTP_404_NOT_FOUND)
+
+
+def annotate_is_subscribed(queryset, user):
+    """Отмечает авторов, на которых подписан пользователь."""
+    if user.is_authenticated:
+        return queryset.annotate(is_subscribed=Exists(
+            user.follower.filter(author=OuterRef('id'))))
+    return queryset.annotate(is_subscribed=Value(False))
+
+
+def apply_user_marks(recipes, user):
+    """
+    Проставляет в сериализованных рецептах отметки пользователя.
+    Избранное, корзина и подписки загружаются тремя запросами на всю
+    страницу вместо подзапросов для каждой строки.
+    """
+    if user.is_anonymous or not recipes:
+        return
+    recipe_ids = [recipe['id'] for recipe in recipes]
+    author_ids = {recipe['author']['id'] for recipe in recipes}
+    favorited = set(Favorite.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    in_shopping_cart = set(ShoppingCart.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    subscribed = set(user.follower.filter(
+        author_id__in=author_ids
+    ).values_list('author_id', flat=True))
+    for recipe in recipes:
+        recipe['is_favorited'] = recipe['id'] in favorited
+        recipe['is_in_shopping_cart'] = recipe['id'] in in_shopping_cart
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in subscribed)
+
+
+def prefetch_latest_recipes(authors, limit=None):
+    """
+    Загружает одним запросом последние limit рецептов каждого автора
+    в атрибут latest_recipes. Рецепты отбираются оконной функцией
+    ROW_NUMBER() с разбиением по автору.
+    """
+    recipes = Recipe.objects.order_by('-pub_date', '-id')
+    if limit is not None and authors:
+        placeholders = ', '.join(['%s'] * len(authors))
+        recipes = recipes.filter(id__in=RawSQL(
+            f'SELECT ranked.id FROM ('
+            f'SELECT id, ROW_NUMBER() OVER ('
+            f'PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+            f') AS position FROM {Recipe._meta.db_table} '
+            f'WHERE author_id IN ({placeholders})'
+            f') ranked WHERE ranked.position <= %s',
+            [author.id for author in authors] + [limit]))
+    prefetch_related_objects(authors, Prefetch(
+        'recipes', queryset=recipes, to_attr='latest_recipes'))
+
 
 class UserViewSet(DjoserUserViewSet):
     """
@@ -35,80 +122,180 @@ class UserViewSet(DjoserUserViewSet):
     pagination_class = CustomPagination
 
     def get_queryset(self):
-        qs = User.objects.prefetch_related('follower', 'following')
-        if self.request.user.is_authenticated:
-            qs = qs.annotate(is_subscribed=Exists(
-                self.request.user.follower
-                .filter(author=OuterRef('id'))))
-            return qs
-        return qs.annotate(is_subscribed=Value(False))
+        return annotate_is_subscribed(User.objects.all(), self.request.user)
+
+    def get_cursor_ordering(self):
+        if self.action == 'subscriptions':
+            return ('-follow_id', )
+        return None
+
+    @staticmethod
+    def subscribed_authors(user):
+        return User.objects.filter(following__user=user).annotate(
+            follow_id=F('following__id'),
+            recipes_count=Count('recipes'),
+            is_subscribed=Value(True),
+        ).order_by('-follow_id')
+
+    @staticmethod
+    def recipes_limit(request):
+        return parse_int(request.query_params.get('recipes_limit'))
 
     @action(
         detail=True,
         methods=['post'],
         permission_classes=[IsAuthenticated],
     )
-    def subscribe(self, request, pk=id):
+    def subscribe(self, request, id=None):
         user = request.user
-        author = get_object_or_404(User, pk=pk)
-        if user == author:
+        author_id = parse_int(id)
+        if author_id is None:
+            return invalid_id_response()
+        if author_id == user.id:
             return Response({
                 'errors': 'Вы не можете подписываться на самого себя!'
             }, status=status.HTTP_400_BAD_REQUEST)
-        if Follow.objects.filter(user=user, author=author).exists():
+        if not Follow.objects.follow(user, author_id):
+            get_object_or_404(User, pk=author_id)
             return Response({
                 'errors': 'Вы уже подписаны на данного пользователя!'
             }, status=status.HTTP_400_BAD_REQUEST)
+        run_in_background(backfill_feed, user.id, author_id)
+        author = self.subscribed_authors(user).get(pk=author_id)
+        prefetch_latest_recipes([author], self.recipes_limit(request))
         serializer = SubscribeListSerializer(
-            author, data=request.data, context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        Follow.objects.create(user=user, author=author)
+            author, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
-    def delete_subscription(self, request, pk=id):
-        subscription = get_object_or_404(Follow,
-                                         user=request.user,
-                                         author=get_object_or_404(
-                                             User, pk=pk))
-        subscription.delete()
+    def delete_subscription(self, request, id=None):
+        author_id = parse_int(id)
+        if author_id is None:
+            return invalid_id_response()
+        deleted, _ = Follow.objects.filter(
+            user=request.user, author_id=author_id).delete()
+        if not deleted:
+            raise Http404
+        run_in_background(remove_from_feed, request.user.id, author_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        user = request.user
-        queryset = User.objects.filter(following__user=user)
-        pages = self.paginate_queryset(queryset)
+        pages = self.paginate_queryset(
+            self.subscribed_authors(request.user))
+        prefetch_latest_recipes(pages, self.recipes_limit(request))
         serializer = SubscribeListSerializer(
             pages, many=True, context={'request': request}
         )
         return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для отображения ингридиентов."""
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly, )
     filter_backends = (IngredientFilter, )
     search_fields = ('^name', )
+    autocomplete_limit = 10
+
+    autocomplete_max_limit = 50
+
+    def get_conditional_state(self, request):
+        return DataVersion.objects.get_version('ingredients'), None
+
+    @action(detail=False, methods=['GET'])
+    def autocomplete(self, request):
+        """Подсказки по названию ингредиента из индекса в памяти."""
+        try:
+            limit = min(
+                int(request.query_params.get('limit',
+                                             self.autocomplete_limit)),
+                self.autocomplete_max_limit)
+        except ValueError:
+            limit = self.autocomplete_limit
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''), max(limit, 1)))
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Вьюсет для работы с тегами."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly, )
 
+    def get_conditional_state(self, request):
+        return DataVersion.objects.get_version('tags'), None
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(ConditionalGetMixin, SharedResponseCacheMixin,
+                    viewsets.ModelViewSet):
     """Вьюсет для работы с рецептами."""
     serializer_class = CreateRecipeSerializer
     permission_classes = (AuthorOrReadOnlyPermission, )
     pagination_class = CustomPagination
-    filter_backends = (DjangoFilterBackend, )
+    filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
+    cursor_ordering = ('-pub_date', '-id')
+    count_cache_namespace = 'recipes'
+    user_filter_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    def get_response_cache_namespaces(self):
+        if self.action == 'retrieve':
+            return ('recipe_details', f'recipe:{self.kwargs["pk"]}')
+        return ('recipe_lists', )
+
+    def personalize(self, request, data):
+        apply_user_marks(
+            data['results'] if 'results' in data else [data], request.user)
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        self.personalize(request, response.data)
+        return response
+
+    def get_conditional_state(self, request):
+        """Состояние рецепта для ETag: дата изменения, поля автора,
+        версии тегов и ингредиентов и отметки текущего пользователя.
+        Всё читается из базы, поэтому ETag зависит только от данных."""
+        if self.action != 'retrieve':
+            return None, None
+        user = request.user
+        recipe = Recipe.objects.filter(pk=self.kwargs['pk'])
+        if user.is_authenticated:
+            recipe = recipe.annotate(
+                is_favorited=Exists(Favorite.objects.filter(
+                    user=user, recipe=OuterRef('id'))),
+                is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('id'))),
+                is_subscribed=Exists(Follow.objects.filter(
+                    user=user, author=OuterRef('author'))))
+        else:
+            recipe = recipe.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_subscribed=Value(False))
+        recipe = recipe.annotate(**{
+            f'{name}_version': Subquery(DataVersion.objects.filter(
+                name=name).values('version'))
+            for name in ('tags', 'ingredients')
+        })
+        state = recipe.values_list(
+            'updated_at', 'is_favorited', 'is_in_shopping_cart',
+            'is_subscribed', 'author__email', 'author__username',
+            'author__first_name', 'author__last_name', 'tags_version',
+            'ingredients_version').first()
+        if state is None:
+            return None, None
+        updated_at, *fields = state
+        # Отметки пользователя не меняют updated_at, поэтому
+        # Last-Modified отдаётся только анонимам.
+        return [updated_at.isoformat(), fields, user.pk], (
+            None if user.is_authenticated else updated_at)
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -116,73 +303,167 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return CreateRecipeSerializer
 
     def get_queryset(self):
-        qs = (
+        return (
             Recipe
             .objects
-            .select_related('author')
-            .prefetch_related('tags', 'ingredients'))
-        if self.request.user.is_authenticated:
-            is_favorited = (
-                Favorite
-                .objects
-                .filter(
-                    user=self.request.user,
-                    recipe=OuterRef('id'))),
-            is_in_shopping_cart = (
-                ShoppingCart
-                .objects
-                .filter(
-                    user=self.request.user,
-                    recipe=OuterRef('id')))
-            qs = qs.annotate(
-                is_favorited=Exists(is_favorited),
-                is_in_shopping_cart=Exists(is_in_shopping_cart))
-            return qs
-        return qs.annotate(
-            is_in_shopping_cart=Value(False),
-            is_favorited=Value(False))
+            .prefetch_related(
+                'tags',
+                Prefetch(
+                    'author',
+                    queryset=User.objects.annotate(
+                        is_subscribed=Value(False))),
+                Prefetch(
+                    'ingredient_list',
+                    queryset=IngredientRecipe.objects.select_related(
+                        'ingredient'))))
 
-    @action(detail=False, methods=['GET'])
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь."""
+        lookups = self.get_queryset()._prefetch_related_lookups
+        queryset = feed_queryset(request.user)
+        if queryset.model is FeedEntry:
+            # Курсор строится по записям ленты, а не по рецептам.
+            self.cursor_ordering = FEED_ORDERING
+            pages = [
+                entry.recipe for entry in self.paginate_queryset(queryset)]
+            prefetch_related_objects(pages, *lookups)
+        else:
+            pages = self.paginate_queryset(
+                queryset.prefetch_related(*lookups))
+        serializer = RecipeReadSerializer(
+            pages, many=True, context={'request': request})
+        response = self.get_paginated_response(serializer.data)
+        self.personalize(request, response.data)
+        return response
+
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=[IsAuthenticated],
+        parser_classes=[ImageUploadParser],
+    )
+    def upload_image(self, request):
+        """
+        Загрузка изображения отдельным multipart-запросом. Полученный id
+        передаётся при создании или изменении рецепта в image_upload.
+        """
+        serializer = UploadedImageSerializer(
+            data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        return Response(get_response_cache_stats())
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=[IsAuthenticated],
+        renderer_classes=tuple(EXPORTERS.values()),
+    )
     def download_shopping_cart(self, request):
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__shopping_list__user=request.user
+        exporter = request.accepted_renderer
+        # Итоги пользователя — небольшой агрегат: читаем его один раз и
+        # по одному и тому же результату строим и ETag, и тело ответа.
+        content = exporter.export(ShoppingCartIngredient.objects.filter(
+            user=request.user
         ).order_by('ingredient__name').values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
-        file = 'shopping_list.txt'
-        response = FileResponse(
-            get_shopping_cart(ingredients),
-            content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename="{file}.txt"'
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ))
+        etag = exporter.etag(content)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        response = HttpResponse(
+            content,
+            content_type=f'{exporter.media_type}; charset={exporter.charset}')
+        response['ETag'] = etag
+        response['Content-Disposition'] = (
+            f'attachment; filename="{exporter.filename}"')
         return response
 
+    @staticmethod
+    def change_recipes(request, model):
+        """
+        Массовое добавление (POST) или удаление (DELETE) рецептов из
+        списка {"recipes": [id, ...]}: одна выборка рецептов, одна
+        вставка или одно удаление и пересчёт счётчиков пачкой.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+        recipe_ids = [recipe.id for recipe in recipes]
+        if request.method == 'DELETE':
+            model.objects.remove_recipes(request.user, recipe_ids)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        added = set(model.objects.add_recipes(request.user, recipe_ids))
+        serializer = RecipeShortSerializer(
+            [recipe for recipe in recipes if recipe.id in added],
+            many=True, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(
+        detail=False,
+        methods=('POST', 'DELETE'),
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart',
+    )
+    def shopping_cart_bulk(self, request):
+        return self.change_recipes(request, ShoppingCart)
+
+    @action(
+        detail=False,
+        methods=('POST', 'DELETE'),
+        permission_classes=[IsAuthenticated],
+        url_path='favorite',
+    )
+    def favorite_bulk(self, request):
+        return self.change_recipes(request, Favorite)
+
+    @staticmethod
+    def add_recipe(request, model, pk, error):
+        """
+        Добавление рецепта в избранное или корзину одной вставкой.
+        Рецепт загружается только для ответа, а при неудачной вставке —
+        чтобы отличить отсутствующий рецепт (404) от повтора (400).
+        """
+        recipe_id = parse_int(pk)
+        if recipe_id is None:
+            return invalid_id_response()
+        if not model.objects.add_recipe(request.user, recipe_id):
+            get_object_or_404(Recipe, pk=recipe_id)
+            return Response(
+                {'errors': error}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = RecipeShortSerializer(
+            Recipe.objects.get(pk=recipe_id), context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def remove_recipe(request, model, pk):
+        recipe_id = parse_int(pk)
+        if recipe_id is None:
+            return invalid_id_response()
+        if not model.objects.remove_recipe(request.user, recipe_id):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(
         detail=True,
         methods=('POST',),
         permission_classes=[IsAuthenticated]
     )
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        data = {
-            'user': request.user.id,
-            'recipe': recipe.id
-        }
-        serializer = ShoppingCartSerializer(
-            data=data,
-            context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_recipe(
+            request, ShoppingCart, pk,
+            'Рецепт уже добавлен в список покупок!')
 
     @shopping_cart.mapping.delete
     def destroy_shopping_cart(self, request, pk):
-        get_object_or_404(
-            ShoppingCart,
-            user=request.user.id,
-            recipe=get_object_or_404(Recipe, id=pk)
-        ).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.remove_recipe(request, ShoppingCart, pk)
 
     @action(
         detail=True,
@@ -190,24 +471,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        data = {
-            'user': request.user.id,
-            'recipe': recipe.id
-        }
-        serializer = FavoriteSerializer(
-            data=data,
-            context={"request": request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_recipe(
+            request, Favorite, pk, 'Рецепт уже был добавлен в избранное!')
 
     @favorite.mapping.delete
     def destroy_favorite(self, request, pk):
-        get_object_or_404(
-            Favorite,
-            user=request.user,
-            recipe=get_object_or_404(Recipe, id=pk)
-        ).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.remove_recipe(request, Favorite, pk)
@@ -83,6 +83,57 @@ else:
         }
     }
 
+# Без REDIS_URL кэш живёт в памяти каждого процесса: сброс версий
+# в одном воркере не виден остальным до истечения TTL.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 300))
+
+CACHE_VERSION_TTL = int(os.getenv('CACHE_VERSION_TTL', 3600))
+
+PAGINATION_COUNT_CACHE_TTL = int(os.getenv('PAGINATION_COUNT_CACHE_TTL', 30))
+
+PAGINATION_ESTIMATED_COUNT = (
+    os.getenv('PAGINATION_ESTIMATED_COUNT', 'False') == 'True')
+
+PAGINATION_ESTIMATED_COUNT_THRESHOLD = int(
+    os.getenv('PAGINATION_ESTIMATED_COUNT_THRESHOLD', 10000))
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
+BACKGROUND_TASKS_SYNC = os.getenv('BACKGROUND_TASKS_SYNC', 'False') == 'True'
+
+BACKGROUND_TASK_WORKERS = int(os.getenv('BACKGROUND_TASK_WORKERS', 2))
+
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 50))
+
+FEED_PULLED_AUTHORS_TTL = int(os.getenv('FEED_PULLED_AUTHORS_TTL', 300))
+
+RECIPE_IMAGE_WIDTHS = (320, 640, 1280)
+
+RECIPE_IMAGE_FORMATS = ('avif', 'webp')
+
+RECIPE_IMAGE_QUALITY = int(os.getenv('RECIPE_IMAGE_QUALITY', 80))
+
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024))
+
+RECIPE_IMAGE_MAX_DIMENSION = int(os.getenv('RECIPE_IMAGE_MAX_DIMENSION', 8000))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -137,3 +188,8 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
+
+MEDIA_GARBAGE_GRACE_PERIOD = int(
+    os.getenv('MEDIA_GARBAGE_GRACE_PERIOD', 24 * 60 * 60))
@@ -0,0 +1,91 @@
+"""
+Настройки gunicorn. Профиль выбирается переменной GUNICORN_PROFILE:
+
+- sync — процессы без потоков, по одному запросу на воркер;
+- gthread — процессы с пулом потоков (по умолчанию);
+- gevent — кооперативные гринлеты, psycopg2 переключается в зелёный
+  режим через psycogreen;
+- uvicorn — ASGI-воркеры, включается и при SERVER_MODE=asgi.
+
+Число воркеров, потоков и соединений считается от числа CPU и
+переопределяется переменными GUNICORN_WORKERS, GUNICORN_THREADS и
+GUNICORN_WORKER_CONNECTIONS.
+"""
+import importlib.util
+import logging
+import multiprocessing
+import os
+import resource
+
+logger = logging.getLogger('gunicorn.error')
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+PROFILE = os.getenv(
+    'GUNICORN_PROFILE', 'uvicorn' if SERVER_MODE == 'asgi' else 'gthread')
+CPU_COUNT = multiprocessing.cpu_count()
+
+WORKER_CLASSES = {
+    'sync': 'sync',
+    'gthread': 'gthread',
+    'gevent': 'gevent',
+    'uvicorn': 'uvicorn.workers.UvicornWorker',
+}
+DEFAULT_WORKERS = {
+    'sync': CPU_COUNT * 2 + 1,
+    'gthread': CPU_COUNT + 1,
+    'gevent': CPU_COUNT + 1,
+    'uvicorn': CPU_COUNT,
+}
+
+if PROFILE not in WORKER_CLASSES:
+    raise RuntimeError(f'Неизвестный профиль gunicorn: {PROFILE}')
+
+wsgi_app = (
+    'foodgram.asgi:application' if PROFILE == 'uvicorn'
+    else 'foodgram.wsgi:application')
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = WORKER_CLASSES[PROFILE]
+workers = int(os.getenv('GUNICORN_WORKERS', DEFAULT_WORKERS[PROFILE]))
+threads = int(os.getenv(
+    'GUNICORN_THREADS', 4 if PROFILE == 'gthread' else 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+
+# Воркер перезапускается после max_requests запросов, jitter разносит
+# перезапуски во времени, чтобы воркеры не уходили на рестарт разом.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+# Метрики воркеров (запросы, коды ответов, длительность) в statsd.
+statsd_host = os.getenv('GUNICORN_STATSD_HOST')
+statsd_prefix = os.getenv('GUNICORN_STATSD_PREFIX', 'foodgram')
+
+
+def post_fork(server, worker):
+    worker.requests_served = 0
+    if PROFILE == 'gevent' and importlib.util.find_spec('psycopg2'):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def post_request(worker, req, environ, resp):
+    worker.requests_served += 1
+
+
+def worker_exit(server, worker):
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    logger.info(
+        'Воркер %s (%s) завершается: запросов %s, пик памяти %s КБ',
+        worker.pid, PROFILE, getattr(worker, 'requests_served', 0), rss)
+
+
+def when_ready(server):
+    logger.info(
+        'Профиль %s: воркеров %s, потоков %s, соединений %s',
+        PROFILE, workers, threads, worker_connections)
@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from .models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingCartIngredient, Tag)
 
 
 class IngredientInline(admin.TabularInline):
@@ -20,9 +20,20 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = (IngredientInline,)
     empty_value_display = '-пусто-'
 
+    def save_related(self, request, form, formsets, change):
+        """Переносит правки ингредиентов в итоги списков покупок."""
+        old_amounts = ShoppingCartIngredient.objects.recipe_amounts(
+            form.instance)
+        super().save_related(request, form, formsets, change)
+        ShoppingCartIngredient.objects.change_recipe(
+            form.instance,
+            old_amounts,
+            ShoppingCartIngredient.objects.recipe_amounts(form.instance))
+
     def get_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
     get_favorites.short_description = 'Избранное'
+    get_favorites.admin_order_field = 'favorites_count'
 
     def get_ingredients(self, obj):
         return ', '.join([
@@ -0,0 +1,106 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from users.models import Follow
+from .models import FeedEntry, Recipe
+
+BATCH_SIZE = 1000
+# Порядок ленты совпадает с индексом feed_user_pub_date_idx.
+FEED_ORDERING = ('-pub_date', '-recipe_id')
+PULLED_AUTHORS_KEY = 'feed:pulled_authors'
+
+
+def _count_pulled_authors():
+    return set(
+        Follow.objects.order_by().values('author_id').annotate(
+            followers=Count('id')
+        ).filter(
+            followers__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('author_id', flat=True))
+
+
+def pulled_authors():
+    """
+    Авторы с очень большим числом подписчиков: их рецепты не
+    раскладываются по лентам, а подмешиваются при чтении. Множество
+    считается одним агрегатом и кэшируется на FEED_PULLED_AUTHORS_TTL
+    секунд, поэтому ни раскладка, ни чтение ленты не считают
+    подписчиков на каждый вызов.
+    """
+    return cache.get_or_set(
+        PULLED_AUTHORS_KEY, _count_pulled_authors,
+        settings.FEED_PULLED_AUTHORS_TTL)
+
+
+def is_pulled(author_id):
+    return author_id in pulled_authors()
+
+
+def fan_out_recipes(recipe_ids):
+    """Добавляет новые рецепты в ленты подписчиков их авторов."""
+    recipes = defaultdict(list)
+    for recipe in Recipe.objects.filter(pk__in=recipe_ids).exclude(
+            author_id__in=pulled_authors()).values(
+                'id', 'author_id', 'pub_date'):
+        recipes[recipe['author_id']].append(recipe)
+    if not recipes:
+        return
+    followers = Follow.objects.filter(
+        author_id__in=recipes
+    ).values_list('user_id', 'author_id').iterator(chunk_size=BATCH_SIZE)
+    batch = []
+    for user_id, author_id in followers:
+        batch.extend(
+            FeedEntry(user_id=user_id, recipe_id=recipe['id'],
+                      author_id=author_id, pub_date=recipe['pub_date'])
+            for recipe in recipes[author_id])
+        if len(batch) >= BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_recipe(recipe_id):
+    fan_out_recipes([recipe_id])
+
+
+def backfill_feed(user_id, author_id):
+    """После подписки переносит в ленту последние рецепты автора."""
+    if is_pulled(author_id):
+        return
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).values('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, recipe_id=recipe['id'],
+                   author_id=author_id, pub_date=recipe['pub_date'])
+         for recipe in recipes],
+        ignore_conflicts=True)
+
+
+def remove_from_feed(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def feed_queryset(user):
+    """
+    Лента пользователя. Обычно это диапазон его записей FeedEntry по
+    индексу (user, -pub_date, -recipe) с рецептами через JOIN, в
+    порядке FEED_ORDERING. Если пользователь подписан на авторов из
+    pulled_authors(), возвращаются рецепты: записи ленты плюс рецепты
+    этих авторов.
+    """
+    pulled = pulled_authors()
+    if pulled:
+        pulled = list(Follow.objects.filter(
+            user=user, author_id__in=pulled
+        ).values_list('author_id', flat=True))
+    if not pulled:
+        return FeedEntry.objects.filter(user=user).select_related(
+            'recipe').order_by(*FEED_ORDERING)
+    return Recipe.objects.filter(
+        Q(id__in=FeedEntry.objects.filter(user=user).values('recipe_id'))
+        | Q(author_id__in=pulled))
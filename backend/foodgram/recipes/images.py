@@ -0,0 +1,100 @@
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .signals import recipe_image_processed
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/image/variants'
+ORIENTATION_TAG = 0x0112
+# Качество, с которым пересохраняется повёрнутый оригинал.
+ORIGINAL_QUALITY = 95
+
+
+def available_formats():
+    """Форматы из RECIPE_IMAGE_FORMATS, которые умеет сохранять Pillow."""
+    Image.init()
+    return [
+        image_format for image_format in settings.RECIPE_IMAGE_FORMATS
+        if image_format.upper() in Image.SAVE
+    ]
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    image.save(
+        buffer, image_format.upper(), quality=settings.RECIPE_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def strip_exif(name, original, image):
+    """
+    Сохраняет копию оригинала без метаданных EXIF и возвращает её
+    имя; image — оригинал после поворота по EXIF. Если метаданных нет,
+    возвращает None. JPEG без поворота пересохраняется с таблицами
+    квантования оригинала (quality='keep'), остальное — с качеством
+    ORIGINAL_QUALITY.
+    """
+    exif = original.getexif()
+    if not exif:
+        return None
+    if original.format == 'JPEG' and exif.get(ORIENTATION_TAG, 1) == 1:
+        clean, options = original, {'quality': 'keep', 'subsampling': 'keep'}
+    else:
+        clean, options = image.copy(), {'quality': ORIGINAL_QUALITY}
+    options['icc_profile'] = original.info.get('icc_profile')
+    clean.info.pop('exif', None)
+    buffer = io.BytesIO()
+    clean.save(buffer, original.format, **options)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def process_recipe_image(recipe_id):
+    """
+    Готовит уменьшенные копии изображения рецепта: поворачивает его по
+    EXIF, заменяет оригинал копией без метаданных и сохраняет варианты
+    шириной RECIPE_IMAGE_WIDTHS в каждом из доступных форматов. Пути к
+    ним записываются в Recipe.image_variants как {формат: {ширина: путь}}.
+    Прежние файлы не удаляются: они могут использоваться другими
+    рецептами, их убирает команда collect_media_garbage.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    original_name = recipe.image.name
+    with recipe.image.open('rb') as file:
+        original = Image.open(file)
+        original.load()
+    image = ImageOps.exif_transpose(original)
+    image_name = strip_exif(original_name, original, image) or original_name
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info
+                              else 'RGB')
+    variants = {}
+    for image_format in available_formats():
+        sizes = {}
+        for width in settings.RECIPE_IMAGE_WIDTHS:
+            if width >= image.width and sizes:
+                break
+            resized = image.copy()
+            resized.thumbnail((width, width * image.height // image.width))
+            name = default_storage.save(
+                f'{VARIANTS_DIR}/{width}.{image_format}',
+                ContentFile(encode(resized, image_format)))
+            sizes[str(resized.width)] = name
+        variants[image_format] = sizes
+    # Если за время обработки изображение заменили, результат устарел:
+    # новое изображение обработает своя задача.
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=original_name
+    ).update(
+        image=image_name, image_variants=variants, updated_at=timezone.now())
+    if updated:
+        recipe_image_processed.send(sender=Recipe, recipe_id=recipe_id)
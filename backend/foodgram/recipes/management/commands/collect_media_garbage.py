@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Recipe, UploadedImage
+
+IMAGE_DIR = 'recipes/image'
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаление изображений, на которые не ссылается ни один рецепт '
+        'или загрузка.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-period', type=int,
+            default=settings.MEDIA_GARBAGE_GRACE_PERIOD,
+            help='Не трогать файлы и загрузки моложе стольких секунд.')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.')
+
+    def handle(self, *args, **options):
+        deadline = timezone.now() - timedelta(
+            seconds=options['grace_period'])
+        if not options['dry_run']:
+            UploadedImage.objects.filter(created__lt=deadline).delete()
+        references = self.count_references(
+            UploadedImage.objects.filter(created__gte=deadline))
+        removed = size = 0
+        for name in self.walk(IMAGE_DIR):
+            if references.get(name):
+                continue
+            if default_storage.get_modified_time(name) >= deadline:
+                continue
+            size += default_storage.size(name)
+            removed += 1
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                default_storage.delete(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов: {removed}, освобождено байт: {size}.'))
+
+    @staticmethod
+    def count_references(uploads):
+        """Число ссылок из рецептов и свежих загрузок на каждый файл."""
+        references = {}
+        recipes = Recipe.objects.values_list('image', 'image_variants')
+        for image, variants in recipes.iterator():
+            names = [image] + [
+                name for sizes in variants.values()
+                for name in sizes.values()]
+            for name in names:
+                references[name] = references.get(name, 0) + 1
+        for name in uploads.values_list('image', flat=True).iterator():
+            references[name] = references.get(name, 0) + 1
+        return references
+
+    def walk(self, path):
+        directories, files = default_storage.listdir(path)
+        for name in files:
+            yield f'{path}/{name}'
+        for directory in directories:
+            yield from self.walk(f'{path}/{directory}')
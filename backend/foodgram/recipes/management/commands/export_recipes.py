@@ -0,0 +1,102 @@
+import json
+import sys
+import tarfile
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.db.models import Prefetch
+
+from recipes.models import IngredientRecipe, Recipe
+
+
+def serialize(recipe):
+    author = recipe.author
+    return {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'image': recipe.image.name,
+        'author': {
+            'email': author.email,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+        },
+        'tags': [
+            {'name': tag.name, 'color': tag.color, 'slug': tag.slug}
+            for tag in recipe.tags.all()
+        ],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.ingredient_list.all()
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгрузка рецептов в NDJSON (по рецепту в строке) и, по желанию, '
+        'их изображений в архив tar.gz.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='-',
+            help='Файл NDJSON, по умолчанию стандартный вывод.')
+        parser.add_argument('--media', help='Архив tar.gz для изображений.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        output = (
+            sys.stdout if options['output'] == '-'
+            else open(options['output'], 'w', encoding='utf-8'))
+        archive = options['media'] and tarfile.open(options['media'], 'w:gz')
+        images = set()
+        count = 0
+        try:
+            for recipe in self.recipes(options['batch_size']):
+                output.write(
+                    json.dumps(serialize(recipe), ensure_ascii=False) + '\n')
+                count += 1
+                if archive and recipe.image.name not in images:
+                    images.add(recipe.image.name)
+                    self.add_image(archive, recipe.image.name)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+            if archive:
+                archive.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {count}, изображений: {len(images)}.'))
+
+    @staticmethod
+    def recipes(batch_size):
+        """Рецепты пачками по id: prefetch_related не работает вместе
+        с iterator(), а весь каталог в память загружать не нужно."""
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch('ingredient_list',
+                     queryset=IngredientRecipe.objects.select_related(
+                         'ingredient').order_by('id')),
+        ).order_by('id')
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return
+            yield from batch
+            last_id = batch[-1].id
+
+    @staticmethod
+    def add_image(archive, name):
+        if not default_storage.exists(name):
+            return
+        info = tarfile.TarInfo(name)
+        info.size = default_storage.size(name)
+        with default_storage.open(name, 'rb') as file:
+            archive.addfile(info, file)
@@ -0,0 +1,186 @@
+import json
+import os
+import sys
+import tarfile
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from recipes.feed import fan_out_recipes
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from recipes.signals import ingredients_loaded, recipes_imported
+from recipes.tasks import run_in_background
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Загрузка рецептов из NDJSON, выгруженного export_recipes. '
+        'Рецепты вставляются пачками, каждая в своей транзакции; рецепт '
+        'автора с уже существующим названием пропускается.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--input', default='-',
+            help='Файл NDJSON, по умолчанию стандартный ввод.')
+        parser.add_argument('--media', help='Архив tar.gz с изображениями.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.images = {}
+        if options['media']:
+            self.extract_media(options['media'])
+        self.users = {}
+        self.tags = {tag.slug: tag.id for tag in Tag.objects.all()}
+        self.ingredients = {
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        }
+        self.ingredients_count = len(self.ingredients)
+        source = (
+            sys.stdin if options['input'] == '-'
+            else open(options['input'], encoding='utf-8'))
+        created = skipped = 0
+        try:
+            lines = (json.loads(line) for line in source if line.strip())
+            while True:
+                batch = list(islice(lines, options['batch_size']))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    added = self.import_batch(batch)
+                created += added
+                skipped += len(batch) - added
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Обработано: {created + skipped}')
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        if len(self.ingredients) != self.ingredients_count:
+            ingredients_loaded.send(sender=Ingredient)
+        recipes_imported.send(sender=Recipe)
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено рецептов: {created}, пропущено: {skipped}.'))
+
+    def extract_media(self, path):
+        """Сохраняет изображения из архива через хранилище и запоминает,
+        под каким именем сохранён каждый файл."""
+        with tarfile.open(path, 'r:gz') as archive:
+            for member in archive:
+                name = os.path.normpath(member.name)
+                if (not member.isfile() or name.startswith(('/', '..'))
+                        or not name.startswith('recipes/')):
+                    continue
+                with archive.extractfile(member) as file:
+                    self.images[member.name] = default_storage.save(
+                        name, file)
+
+    def import_batch(self, batch):
+        authors = self.get_users([item['author'] for item in batch])
+        existing = set(Recipe.objects.filter(
+            author_id__in=set(authors.values()),
+            name__in={item['name'] for item in batch},
+        ).values_list('author_id', 'name'))
+        items, recipes = [], []
+        for item in batch:
+            author_id = authors[item['author']['email']]
+            if (author_id, item['name']) in existing:
+                continue
+            existing.add((author_id, item['name']))
+            items.append(item)
+            recipes.append(Recipe(
+                author_id=author_id,
+                name=item['name'],
+                text=item['text'],
+                cooking_time=item['cooking_time'],
+                image=self.images.get(item['image'], item['image']),
+            ))
+        if not recipes:
+            return 0
+        self.create(Recipe, recipes)
+        for recipe, item in zip(recipes, items):
+            recipe.pub_date = parse_datetime(item['pub_date'])
+        # auto_now_add перезаписывает дату при вставке.
+        Recipe.objects.bulk_update(recipes, ['pub_date'])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=self.get_tag(tag))
+            for recipe, item in zip(recipes, items)
+            for tag in item['tags']
+        ])
+        self.get_ingredients(
+            ingredient for item in items for ingredient in item['ingredients'])
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(
+                recipe_id=recipe.id,
+                ingredient_id=self.ingredients[
+                    ingredient['name'], ingredient['measurement_unit']],
+                amount=ingredient['amount'],
+            )
+            for recipe, item in zip(recipes, items)
+            for ingredient in item['ingredients']
+        ])
+        # bulk_create не вызывает post_save, поэтому ленты подписчиков
+        # заполняются явно, после фиксации пачки.
+        run_in_background(fan_out_recipes, [recipe.id for recipe in recipes])
+        return len(recipes)
+
+    @staticmethod
+    def create(model, objects):
+        """bulk_create там, где база возвращает первичные ключи
+        вставленных строк; на SQLite объекты сохраняются по одному."""
+        if connection.features.can_return_rows_from_bulk_insert:
+            model.objects.bulk_create(objects)
+        else:
+            for obj in objects:
+                obj.save()
+
+    def get_users(self, authors):
+        missing = {
+            author['email']: author for author in authors
+            if author['email'] not in self.users
+        }
+        self.users.update(User.objects.filter(
+            email__in=missing).values_list('email', 'id'))
+        for email, author in missing.items():
+            if email in self.users:
+                continue
+            if User.objects.filter(username=author['username']).exists():
+                raise CommandError(
+                    f'Имя пользователя {author["username"]} уже занято.')
+            user = User(**author)
+            user.set_unusable_password()
+            user.save()
+            self.users[email] = user.id
+        return self.users
+
+    def get_tag(self, data):
+        if data['slug'] not in self.tags:
+            self.tags[data['slug']] = Tag.objects.get_or_create(
+                slug=data['slug'],
+                defaults={'name': data['name'], 'color': data['color']},
+            )[0].id
+        return self.tags[data['slug']]
+
+    def get_ingredients(self, ingredients):
+        missing = {
+            (item['name'], item['measurement_unit'])
+            for item in ingredients
+        } - self.ingredients.keys()
+        if not missing:
+            return
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name, measurement_unit=unit)
+             for name, unit in missing],
+            ignore_conflicts=True)
+        self.ingredients.update({
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.filter(
+                name__in={name for name, _ in missing}
+            ).values_list('id', 'name', 'measurement_unit')
+        })
@@ -1,22 +1,191 @@
 import csv
+import io
+import json
+import os
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
 from recipes.models import Ingredient
+from recipes.signals import ingredients_loaded
+
+FORMATS = {
+    '.csv': 'csv',
+    '.json': 'json',
+    '.jsonl': 'ndjson',
+    '.ndjson': 'ndjson',
+}
+FIELDS = ('name', 'measurement_unit')
+CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Строки «название,единица»; строка заголовка пропускается."""
+    for row in csv.reader(file):
+        if not row or tuple(row) == FIELDS:
+            continue
+        if len(row) != 2:
+            raise CommandError(f'Неверная строка CSV: {row}')
+        yield row[0].strip(), row[1].strip()
+
+
+def read_json(file):
+    """Потоковое чтение JSON-массива объектов без загрузки файла
+    целиком: объекты разбираются по одному по мере чтения."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Файл JSON оборвался.')
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield item['name'].strip(), item['measurement_unit'].strip()
+
+
+def read_ndjson(file):
+    for line in file:
+        if line.strip():
+            item = json.loads(line)
+            yield item['name'].strip(), item['measurement_unit'].strip()
+
+
+READERS = {'csv': read_csv, 'json': read_json, 'ndjson': read_ndjson}
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class CopyStream(io.RawIOBase):
+    """Файлоподобный объект для COPY: отдаёт строки CSV по мере чтения
+    из источника и считает их."""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = bytearray()
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            line = io.StringIO()
+            csv.writer(line).writerow(row)
+            self.buffer += line.getvalue().encode()
+            self.count += 1
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:len(data)]
+        return data
 
 
 class Command(BaseCommand):
-    help = 'Загрузка данных из csv файла.'
-
-    def handle(self, *args, **kwargs):
-        data_path = settings.BASE_DIR
-        with open(
-            f'{data_path}/data/ingredients.csv',
-            'r',
-            encoding='utf-8'
-        ) as csv_file:
-            reader = csv.DictReader(csv_file)
+    help = (
+        'Загрузка ингредиентов из CSV, JSON или NDJSON. Уже существующие '
+        'ингредиенты пропускаются, поэтому команду можно запускать '
+        'повторно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=os.path.join(settings.BASE_DIR, 'data'),
+            help='Файл или каталог с ingredients.csv/ingredients.json.')
+        parser.add_argument(
+            '--format', choices=sorted(READERS),
+            help='Формат файла, по умолчанию определяется по расширению.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY на PostgreSQL.')
+
+    def handle(self, *args, **options):
+        path = self.resolve_path(options['path'])
+        file_format = options['format'] or FORMATS.get(
+            os.path.splitext(path)[1].lower())
+        if file_format is None:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        before = Ingredient.objects.count()
+        started = time.perf_counter()
+        with open(path, encoding='utf-8', newline='') as file:
+            rows = READERS[file_format](file)
+            if connection.vendor == 'postgresql' and not options['no_copy']:
+                read = self.copy(rows)
+            else:
+                read = self.bulk_create(
+                    rows, options['batch_size'], options['verbosity'])
+        elapsed = time.perf_counter() - started
+        created = Ingredient.objects.count() - before
+        ingredients_loaded.send(sender=Ingredient)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {read}, добавлено {created}, пропущено '
+            f'{read - created} ингредиентов за {elapsed:.2f} с '
+            f'({read / elapsed if elapsed else read:.0f} строк/с).'))
+
+    @staticmethod
+    def resolve_path(path):
+        if not os.path.isdir(path):
+            if not os.path.exists(path):
+                raise CommandError(f'Файл не найден: {path}')
+            return path
+        for name in ('ingredients.csv', 'ingredients.json'):
+            if os.path.exists(os.path.join(path, name)):
+                return os.path.join(path, name)
+        raise CommandError(f'В каталоге {path} нет файла ингредиентов.')
+
+    def bulk_create(self, rows, batch_size, verbosity):
+        read = 0
+        for batch in batches(rows, batch_size):
             Ingredient.objects.bulk_create(
-                Ingredient(**data) for data in reader)
-        self.stdout.write(self.style.SUCCESS('Все ингредиенты загружены!'))
+                [Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in batch],
+                ignore_conflicts=True)
+            read += len(batch)
+            if verbosity > 1:
+                self.stdout.write(f'Обработано строк: {read}')
+        return read
+
+    @staticmethod
+    def copy(rows):
+        """
+        COPY во временную таблицу и одна вставка из неё с пропуском
+        конфликтов по unique_name_measurement_unit.
+        """
+        table = Ingredient._meta.db_table
+        stream = CopyStream(rows)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_staging '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP')
+            cursor.copy_expert(
+                'COPY ingredient_staging (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', stream)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT name, measurement_unit FROM ingredient_staging '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING')
+        return stream.count
@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+
+from recipes.feed import backfill_feed
+from recipes.models import FeedEntry
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = 'Пересборка лент подписок из текущих подписок.'
+
+    def handle(self, *args, **kwargs):
+        FeedEntry.objects.all().delete()
+        follows = Follow.objects.values_list('user_id', 'author_id')
+        for user_id, author_id in follows.iterator():
+            backfill_feed(user_id, author_id)
+        self.stdout.write(self.style.SUCCESS('Ленты подписок пересобраны!'))
@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт итогов списков покупок.'
+
+    def handle(self, *args, **kwargs):
+        ShoppingCartIngredient.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересчитаны!'))
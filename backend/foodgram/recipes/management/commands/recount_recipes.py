@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+
+def count_for_recipe(model):
+    return Coalesce(Subquery(
+        model.objects
+        .filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(total=Count('id'))
+        .values('total')
+    ), Value(0))
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков избранного и списков покупок у рецептов.'
+
+    def handle(self, *args, **kwargs):
+        updated = Recipe.objects.update(
+            favorites_count=count_for_recipe(Favorite),
+            in_carts_count=count_for_recipe(ShoppingCart),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны у {updated} рецептов!'))
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_feeds(apps, schema_editor):
+    """Ленты для подписок, оформленных до появления FeedEntry: последние
+    FEED_BACKFILL_SIZE рецептов каждого автора, кроме авторов с числом
+    подписчиков больше FEED_FANOUT_LIMIT, которые подмешиваются при
+    чтении."""
+    Follow = apps.get_model('users', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    pulled = set(
+        Follow.objects.order_by().values('author_id').annotate(
+            followers=models.Count('id')
+        ).filter(
+            followers__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('author_id', flat=True))
+    # Подписки идут по авторам, поэтому рецепты запрашиваются один раз
+    # на автора.
+    follows = Follow.objects.exclude(author_id__in=pulled).order_by(
+        'author_id').values_list('user_id', 'author_id')
+    current_author, recipes, batch = None, [], []
+    for user_id, author_id in follows.iterator():
+        if author_id != current_author:
+            current_author = author_id
+            recipes = list(
+                Recipe.objects.filter(author_id=author_id).order_by(
+                    '-pub_date', '-id'
+                ).values_list('id', 'pub_date')[
+                    :settings.FEED_BACKFILL_SIZE])
+        batch.extend(
+            FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                      author_id=author_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes)
+        if len(batch) >= 1000:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('recipes', '0011_feed_index_recipe'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -2,7 +2,8 @@ from colorfield.fields import ColorField
 from django.conf import settings
 from django.core.validators import (MinValueValidator,
                                     RegexValidator)
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.functions import Greatest
 
 
 class Tag(models.Model):
@@ -82,6 +83,12 @@ class Recipe(models.Model):
         verbose_name='Изображение рецепта',
         upload_to='recipes/image/',
     )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
     )
@@ -110,16 +117,61 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        db_index=True,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+    )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
 
 
+class UploadedImage(models.Model):
+    """Изображение, загруженное заранее для последующего рецепта."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='uploaded_images',
+    )
+    image = models.ImageField(
+        verbose_name='Изображение',
+        upload_to='recipes/image/',
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата загрузки',
+        auto_now_add=True,
+    )
+
+    class Meta:
+        ordering = ['-created']
+        verbose_name = 'Загруженное изображение'
+        verbose_name_plural = 'Загруженные изображения'
+
+    def __str__(self):
+        return self.image.name
+
+
 class IngredientRecipe(models.Model):
     """Модель для связи ингридиентов и рецепта."""
     ingredient = models.ForeignKey(
@@ -159,8 +211,97 @@ class IngredientRecipe(models.Model):
         )
 
 
+class ShoppingCartFavoritesManager(models.Manager):
+    """Добавление и удаление рецептов пользователя без предварительных
+    проверок: дубликаты отсекает ограничение уникальности."""
+
+    @transaction.atomic
+    def add_recipe(self, user, recipe_id):
+        """
+        Одна вставка, которая ничего не делает, если рецепта нет или он
+        уже добавлен. Возвращает True, если запись создана.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.model._meta.db_table} '
+                f'(user_id, recipe_id) '
+                f'SELECT %s, id FROM {Recipe._meta.db_table} WHERE id = %s '
+                f'ON CONFLICT DO NOTHING',
+                (user.id, recipe_id))
+            added = cursor.rowcount == 1
+        if added:
+            self.model.recipes_changed(user.id, [recipe_id], 1)
+        return added
+
+    @transaction.atomic
+    def remove_recipe(self, user, recipe_id):
+        """
+        Одно удаление в обход сигналов удаления, чтобы счётчики не
+        изменились дважды. Возвращает True, если запись была.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.model._meta.db_table} '
+                f'WHERE user_id = %s AND recipe_id = %s',
+                (user.id, recipe_id))
+            deleted = cursor.rowcount == 1
+        if deleted:
+            self.model.recipes_changed(user.id, [recipe_id], -1)
+        return deleted
+
+    @transaction.atomic
+    def add_recipes(self, user, recipe_ids):
+        """
+        Добавляет рецепты, которых ещё нет, и возвращает их id. Какие
+        строки вставлены, сообщает сама вставка (RETURNING), поэтому
+        параллельные запросы не учитывают один рецепт дважды.
+        """
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        if not recipe_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.model._meta.db_table} '
+                f'(user_id, recipe_id) '
+                f'SELECT %s, id FROM {Recipe._meta.db_table} '
+                f'WHERE id IN ({placeholders}) '
+                f'ON CONFLICT DO NOTHING RETURNING recipe_id',
+                (user.id, *recipe_ids))
+            inserted = {row[0] for row in cursor.fetchall()}
+        added = [
+            recipe_id for recipe_id in recipe_ids if recipe_id in inserted]
+        self.model.recipes_changed(user.id, added, 1)
+        return added
+
+    @transaction.atomic
+    def remove_recipes(self, user, recipe_ids):
+        """Удаляет рецепты одним запросом и возвращает id удалённых."""
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        if not recipe_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.model._meta.db_table} '
+                f'WHERE user_id = %s AND recipe_id IN ({placeholders}) '
+                f'RETURNING recipe_id',
+                (user.id, *recipe_ids))
+            deleted = {row[0] for row in cursor.fetchall()}
+        removed = [
+            recipe_id for recipe_id in recipe_ids if recipe_id in deleted]
+        self.model.recipes_changed(user.id, removed, -1)
+        return removed
+
+
 class ShoppingCartFavorites(models.Model):
-    """Общая модель для списка покупок и избранного."""
+    """Общая модель для списка покупок и избранного.
+    Поддерживает счётчик рецепта, указанный в counter_field (а список
+    покупок — ещё и итоги по ингредиентам): при сохранении и удалении
+    через ORM их меняют обработчики сигналов (в том числе при каскадном
+    удалении и удалении из админки), а методы менеджера — напрямую."""
+    counter_field = None
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         verbose_name='Пользователь',
@@ -182,12 +323,23 @@ class ShoppingCartFavorites(models.Model):
             )
         ]
 
+    objects = ShoppingCartFavoritesManager()
+
     def __str__(self):
         return f'{self.user}, {self.recipe}.'
 
+    @classmethod
+    def recipes_changed(cls, user_id, recipe_ids, delta):
+        if recipe_ids:
+            Recipe.objects.filter(pk__in=recipe_ids).update(**{
+                cls.counter_field: models.F(cls.counter_field) + delta
+            })
+
 
 class Favorite(ShoppingCartFavorites):
     """Модель для добавления рецептов в избранное."""
+    counter_field = 'favorites_count'
+
     class Meta(ShoppingCartFavorites.Meta):
         default_related_name = 'favorites'
         verbose_name = 'Избранное'
@@ -196,7 +348,241 @@ class Favorite(ShoppingCartFavorites):
 
 class ShoppingCart(ShoppingCartFavorites):
     """Модель для добавления ингридиентов в список покупок."""
+    counter_field = 'in_carts_count'
+
     class Meta(ShoppingCartFavorites.Meta):
         default_related_name = 'shopping_cart'
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
+
+    @classmethod
+    def recipes_changed(cls, user_id, recipe_ids, delta):
+        super().recipes_changed(user_id, recipe_ids, delta)
+        ShoppingCartIngredient.objects.apply(
+            [user_id],
+            ShoppingCartIngredient.objects.recipe_amounts(recipe_ids),
+            sign=delta)
+
+
+class FeedEntry(models.Model):
+    """Запись в ленте рецептов от авторов, на которых подписан
+    пользователь. Заполняется при публикации рецепта."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Автор рецепта',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_user_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+
+class ShoppingCartIngredientManager(models.Manager):
+    """Инкрементальное обновление итогов списка покупок."""
+
+    @transaction.atomic
+    def apply(self, user_ids, amounts, sign=1):
+        """
+        Прибавляет (sign=1) или вычитает (sign=-1) количества
+        ингредиентов {ingredient_id: amount} у пользователей user_ids.
+        Прибавление — вставка с ON CONFLICT DO UPDATE, поэтому
+        параллельные добавления одного ингредиента не конфликтуют по
+        уникальности; при вычитании обнулившиеся строки удаляются.
+        """
+        user_ids = set(user_ids)
+        amounts = {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not user_ids or not amounts:
+            return
+        added = [
+            (user_id, ingredient_id, amount)
+            for user_id in user_ids
+            for ingredient_id, amount in amounts.items() if amount > 0
+        ]
+        self._upsert(added)
+        subtracted = {
+            ingredient_id: -amount
+            for ingredient_id, amount in amounts.items() if amount < 0
+        }
+        if not subtracted:
+            return
+        totals = self.filter(
+            user_id__in=user_ids, ingredient_id__in=subtracted)
+        totals.update(amount=Greatest(
+            models.F('amount') - models.Case(
+                *(models.When(ingredient_id=ingredient_id, then=amount)
+                  for ingredient_id, amount in subtracted.items()),
+                output_field=models.PositiveIntegerField()),
+            0,
+            output_field=models.PositiveIntegerField()))
+        totals.filter(amount=0).delete()
+
+    def _upsert(self, rows, batch_size=300):
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cursor.execute(
+                    f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+                    f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                    f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                    f'SET amount = {table}.amount + EXCLUDED.amount',
+                    [value for row in batch for value in row])
+
+    @staticmethod
+    def recipe_amounts(recipes):
+        """Суммарные количества ингредиентов рецепта или списка
+        рецептов (объектов или id)."""
+        if isinstance(recipes, Recipe):
+            recipes = [recipes]
+        return dict(
+            IngredientRecipe.objects
+            .filter(recipe__in=recipes)
+            .values('ingredient_id')
+            .annotate(total=models.Sum('amount'))
+            .order_by()
+            .values_list('ingredient_id', 'total'))
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Переносит изменение состава рецепта в списки покупок
+        всех пользователей, у которых он лежит в корзине."""
+        deltas = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0))
+            for ingredient_id in {*old_amounts, *new_amounts}
+        }
+        user_ids = ShoppingCart.objects.filter(
+            recipe=recipe).values_list('user_id', flat=True)
+        self.apply(user_ids, deltas)
+
+    @transaction.atomic
+    def rebuild(self):
+        """Пересчитывает итоги всех списков покупок заново."""
+        self.all().delete()
+        totals = (
+            IngredientRecipe.objects
+            .filter(recipe__shopping_cart__isnull=False)
+            .values('ingredient_id',
+                    user_id=models.F('recipe__shopping_cart__user_id'))
+            .annotate(total=models.Sum('amount'))
+            .order_by())
+        self.bulk_create(
+            [self.model(user_id=row['user_id'],
+                        ingredient_id=row['ingredient_id'],
+                        amount=row['total']) for row in totals],
+            batch_size=1000)
+
+
+class ShoppingCartIngredient(models.Model):
+    """Итоговое количество ингредиента в списке покупок пользователя."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        verbose_name='Ингридиент',
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+    )
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        ordering = ['-id']
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+
+class DataVersionManager(models.Manager):
+    """Счётчики версий данных для ETag."""
+
+    def get_version(self, name):
+        return self.filter(name=name).values_list(
+            'version', flat=True).first() or 0
+
+    @transaction.atomic
+    def bump(self, *names):
+        self.bulk_create(
+            [self.model(name=name) for name in names],
+            ignore_conflicts=True)
+        self.filter(name__in=names).update(
+            version=models.F('version') + 1)
+
+
+class DataVersion(models.Model):
+    """Версия набора данных (например, всех ингредиентов). Хранится в
+    базе, поэтому одинакова во всех воркерах и меняется только вместе
+    с данными."""
+    name = models.CharField(
+        verbose_name='Название',
+        max_length=100,
+        unique=True,
+    )
+    version = models.PositiveBigIntegerField(
+        verbose_name='Версия',
+        default=0,
+    )
+
+    objects = DataVersionManager()
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
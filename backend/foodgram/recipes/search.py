@@ -0,0 +1,59 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+SQLITE_TABLE = 'recipes_recipe_fts'
+
+
+def search_recipes(queryset, value):
+    """Полнотекстовый поиск по названию и описанию рецепта."""
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(queryset, value)
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(queryset, value)
+    return queryset.filter(name__icontains=value)
+
+
+def _search_postgresql(queryset, value):
+    table = queryset.model._meta.db_table
+    query = 'websearch_to_tsquery(%s, %s)'
+    return queryset.annotate(search_rank=RawSQL(
+        f'ts_rank({table}.search_vector, {query}) '
+        f'+ similarity({table}.name, %s)',
+        (SEARCH_CONFIG, value, value),
+        output_field=FloatField(),
+    )).filter(RawSQL(
+        f'({table}.search_vector @@ {query} OR {table}.name %% %s)',
+        (SEARCH_CONFIG, value, value),
+        output_field=BooleanField(),
+    )).order_by('-search_rank', '-pub_date')
+
+
+def _search_sqlite(queryset, value):
+    terms = re.findall(r'\w+', value)
+    if not terms:
+        return queryset
+    match = ' '.join(f'"{term}"*' for term in terms)
+    return queryset.filter(id__in=RawSQL(
+        f'SELECT rowid FROM {SQLITE_TABLE} '
+        f'WHERE {SQLITE_TABLE} MATCH %s ORDER BY rank',
+        (match,),
+    ))
+
+
+def update_sqlite_index(connection, recipe, deleted=False):
+    """Поддерживает таблицу FTS5 на SQLite в актуальном состоянии.
+    На PostgreSQL поисковый вектор вычисляется самой базой."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s', (recipe.pk,))
+        if not deleted:
+            cursor.execute(
+                f'INSERT INTO {SQLITE_TABLE} (rowid, name, text) '
+                f'VALUES (%s, %s, %s)',
+                (recipe.pk, recipe.name, recipe.text))
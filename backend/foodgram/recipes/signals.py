@@ -0,0 +1,50 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from .feed import fan_out_recipe
+from .models import Favorite, Recipe, ShoppingCart
+from .search import update_sqlite_index
+from .tasks import run_in_background
+
+# Отправляются после массовой загрузки ингредиентов и рецептов и после
+# обработки изображения рецепта, которые не вызывают post_save.
+ingredients_loaded = Signal()
+recipes_imported = Signal()
+recipe_image_processed = Signal()
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(instance, using, **kwargs):
+    update_sqlite_index(connections[using], instance)
+
+
+@receiver(post_save, sender=Recipe)
+def publish_recipe(instance, created, **kwargs):
+    """Раскладывает новый рецепт по лентам подписчиков после фиксации
+    транзакции, как бы он ни был создан: через API, админку или
+    shell."""
+    if created:
+        run_in_background(fan_out_recipe, instance.id)
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(instance, using, **kwargs):
+    update_sqlite_index(connections[using], instance, deleted=True)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def count_added_recipe(sender, instance, created, **kwargs):
+    if created:
+        sender.recipes_changed(instance.user_id, [instance.recipe_id], 1)
+
+
+@receiver(pre_delete, sender=Favorite)
+@receiver(pre_delete, sender=ShoppingCart)
+def count_removed_recipe(sender, instance, **kwargs):
+    """Срабатывает и при каскадном удалении пользователя или рецепта,
+    и при удалении набора записей из админки. Состав рецепта к этому
+    моменту ещё не удалён, поэтому итоги списка покупок вычитаются
+    верно."""
+    sender.recipes_changed(instance.user_id, [instance.recipe_id], -1)
@@ -0,0 +1,45 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла — SHA-256 его содержимого:
+    recipes/image/ab/ab12….png. Повторная загрузка того же файла не
+    создаёт копию, а возвращает имя уже сохранённого. Поэтому файл
+    может принадлежать нескольким записям и удалять его напрямую
+    нельзя; неиспользуемые файлы удаляет команда collect_media_garbage.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        if os.path.basename(directory) == digest[:2]:
+            # Имя уже в формате хранилища, например при повторном
+            # сохранении файла из этого же хранилища.
+            directory = os.path.dirname(directory)
+        name = '/'.join(
+            part for part in (directory, digest[:2], digest + extension)
+            if part)
+        if self.exists(name):
+            # collect_media_garbage не трогает файлы новее своего срока
+            # хранения, поэтому повторно использованный файл считается
+            # только что сохранённым.
+            try:
+                os.utime(self.path(name))
+            except FileNotFoundError:
+                pass
+            else:
+                return name
+        return super().save(name, content, max_length)
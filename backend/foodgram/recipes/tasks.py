@@ -0,0 +1,40 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.BACKGROUND_TASK_WORKERS,
+    thread_name_prefix='background-task',
+)
+
+
+def _run(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой',
+                         func.__name__)
+    finally:
+        connections.close_all()
+
+
+def run_in_background(func, *args):
+    """
+    Выполняет func(*args) в фоновом потоке после фиксации текущей
+    транзакции. При BACKGROUND_TASKS_SYNC задача выполняется сразу
+    в том же потоке, что удобно для отладки и тестов.
+
+    Очередь живёт в памяти процесса: задачи, не выполненные до
+    перезапуска воркера, теряются. Ленты после этого восстанавливает
+    rebuild_feeds, изображения — process_recipe_images.
+    """
+    def submit():
+        if settings.BACKGROUND_TASKS_SYNC:
+            func(*args)
+        else:
+            executor.submit(_run, func, args)
+    transaction.on_commit(submit)
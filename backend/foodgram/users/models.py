@@ -1,6 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
-from django.db import models
+from django.db import connection, models
 from django.db.models import UniqueConstraint
 
 
@@ -37,6 +37,23 @@ class User(AbstractUser):
         return self.username
 
 
+class FollowManager(models.Manager):
+
+    def follow(self, user, author_id):
+        """
+        Одна вставка, которая ничего не делает, если автора нет или
+        подписка уже есть. Возвращает True, если подписка создана.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.model._meta.db_table} '
+                f'(user_id, author_id) '
+                f'SELECT %s, id FROM {User._meta.db_table} WHERE id = %s '
+                f'ON CONFLICT DO NOTHING',
+                (user.id, author_id))
+            return cursor.rowcount == 1
+
+
 class Follow(models.Model):
     """ Модель подписки на автора. """
     user = models.ForeignKey(
@@ -52,6 +69,8 @@ class Follow(models.Model):
         related_name='following'
     )
 
+    objects = FollowManager()
+
     class Meta:
         ordering = ('-id', )
         constraints = [